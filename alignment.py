@@ -1,8 +1,15 @@
+import numpy as np
+from array import array
+from rapidfuzz import process
 from rapidfuzz.distance import Indel
-from itertools import groupby, combinations
+from itertools import groupby
 import spacy.parts_of_speech as POS
+from spacy.attrs import LEMMA, LOWER, POS as POS_ATTR
 from re import sub
+from string import punctuation
 from edit import Edit
+from features import TokenFeatures
+import metrics
 
 def is_punct(token):
     return token.pos == POS.PUNCT or token.text in punctuation
@@ -16,76 +23,268 @@ def merge_edits(seq):
 
 open_pos = {POS.ADJ, POS.AUX, POS.ADV, POS.NOUN, POS.VERB}
 
+# Operation codes stored in Alignment.op_matrix; a transposition of k tokens
+# is stored as -k.
+O, M, S, I, D = range(5)
+OPS = "OMSID"
+
+def lcs_windows(orig_feats, cor_feats, min_anchor=4, margin=2):
+    # Splits the pair into (o_start, o_end, c_start, c_end, equal) windows
+    # using the token-level LCS of orth ids. Equal runs of at least
+    # min_anchor tokens become anchors. Every differing window takes
+    # `margin` tokens of context from the anchors on either side, so
+    # transpositions reaching just past a differing region still fall
+    # inside a window.
+    # Anchoring is an approximation of the full DP: a window's costs start
+    # from zero at its corner, so ties and transposition checks can resolve
+    # differently and a small share of pairs get a slightly different
+    # alignment. Without context (margin=0) that share is large, so at
+    # least one token of margin is required.
+    if margin < 1:
+        raise ValueError("margin must be at least 1, got {0}".format(margin))
+    o_len = len(orig_feats)
+    c_len = len(cor_feats)
+    anchors = [(o0, o1, c0, c1) for tag, o0, o1, c0, c1 in Indel.opcodes(orig_feats.orth, cor_feats.orth)
+               if tag == "equal" and o1-o0 >= max(min_anchor, 2*margin+1)]
+    windows = []
+    o_start = c_start = 0
+    for o0, o1, c0, c1 in anchors:
+        head = 0 if o0 == 0 and c0 == 0 else margin
+        tail = 0 if o1 == o_len and c1 == c_len else margin
+        if o_start < o0 + head or c_start < c0 + head:
+            windows.append((o_start, o0 + head, c_start, c0 + head, False))
+        windows.append((o0 + head, o1 - tail, c0 + head, c1 - tail, True))
+        o_start, c_start = o1 - tail, c1 - tail
+    if o_start < o_len or c_start < c_len:
+        windows.append((o_start, o_len, c_start, c_len, False))
+    return windows
+
+def lcs_blocks(orig_feats, cor_feats):
+    # The differing (o_start, o_end, c_start, c_end) blocks between the
+    # token-level LCS matches of orth ids. Indel has no substitution, so a
+    # replaced run comes out as a deletion followed by an insertion; such
+    # touching blocks are merged into one.
+    blocks = []
+    for tag, o0, o1, c0, c1 in Indel.opcodes(orig_feats.orth, cor_feats.orth):
+        if tag == "equal":
+            continue
+        if blocks and blocks[-1][1] == o0 and blocks[-1][3] == c0:
+            blocks[-1] = (blocks[-1][0], o1, blocks[-1][2], c1)
+        else:
+            blocks.append((o0, o1, c0, c1))
+    return blocks
+
 class Alignment:
     _open_pos = {POS.ADJ, POS.ADV, POS.NOUN, POS.VERB}
 
-    def __init__(self, orig, cor):
+    def __init__(self, orig, cor, orig_feats=None, cor_feats=None, anchored=False, min_anchor=4, margin=2, lean=False, max_cells=1000000, max_transposition=None, debug=False, windows=None):
         self.orig = orig
         self.cor = cor
+        self.orig_feats = TokenFeatures(orig) if orig_feats is None else orig_feats
+        self.cor_feats = TokenFeatures(cor) if cor_feats is None else cor_feats
+        self.cost_matrix = None
+        self.op_matrix = None
+
+        # Callers may pass their own (o_start, o_end, c_start, c_end, equal)
+        # windows in document order, e.g. sentence pairs; only those ranges
+        # are aligned.
+        if windows is not None:
+            anchored = True
+        elif anchored:
+            windows = self.get_windows(min_anchor, margin)
+        else:
+            windows = [(0, len(orig), 0, len(cor), False)]
+        align_seq = []
+        for o_start, o_end, c_start, c_end, equal in windows:
+            if equal:
+                align_seq.extend(("M", o_start+n, o_start+n+1, c_start+n, c_start+n+1) for n in range(o_end-o_start))
+            elif lean and (o_end-o_start)*(c_end-c_start) > max_cells:
+                for block in self.split_window(o_start, o_end, c_start, c_end, max_cells):
+                    align_seq.extend(self.align_window(*block, lean=True, max_transposition=max_transposition)[0])
+            else:
+                seq, cost_matrix, op_matrix = self.align_window(o_start, o_end, c_start, c_end, lean, max_transposition)
+                align_seq.extend(seq)
+                if debug and not anchored:
+                    self.cost_matrix = np.array(cost_matrix)
+                    self.op_matrix = np.array(op_matrix, dtype=np.int32)
+        self.align_seq = align_seq
 
-        o_len = len(orig)
-        c_len = len(cor)
-        o_low = [o.lower for o in orig]
-        c_low = [c.lower for c in cor]
-        cost_matrix = [[0.0 for j in range(c_len+1)] for i in range(o_len+1)]
-        op_matrix = [["O" for j in range(c_len+1)] for i in range(o_len+1)]
+    def get_windows(self, min_anchor=4, margin=2):
+        return lcs_windows(self.orig_feats, self.cor_feats, min_anchor, margin)
+
+    def align_window(self, o_start, o_end, c_start, c_end, lean=False, max_transposition=None):
+        # Runs the DP over orig[o_start:o_end] and cor[c_start:c_end] and
+        # returns the alignment in document offsets along with the window's
+        # cost and operation matrices.
+        cost_matrix, op_matrix = self.fill_window(o_start, o_end, c_start, c_end, lean, max_transposition)
+        return self.backtrace(op_matrix, o_start, o_end, c_start, c_end), cost_matrix, op_matrix
+
+    def fill_window(self, o_start, o_end, c_start, c_end, lean=False, max_transposition=None):
+        # With lean=True the matrices are rows of unboxed doubles and ints
+        # instead of lists of Python objects. max_transposition caps the
+        # number of tokens a transposition spans; 0 or 1 disables them.
+        o_len = o_end - o_start
+        c_len = c_end - c_start
+        o_orth = self.orig_feats.orth[o_start:o_end]
+        c_orth = self.cor_feats.orth[c_start:c_end]
+        o_low = self.orig_feats.lower[o_start:o_end]
+        c_low = self.cor_feats.lower[c_start:c_end]
+        sub_matrix = self.get_sub_cost_matrix(o_start, o_end, c_start, c_end)
+        if max_transposition is not None and max_transposition < 0:
+            raise ValueError("max_transposition must not be negative, got {0}".format(max_transposition))
+        max_k = float("inf") if max_transposition is None else max_transposition
+        probes = 0
+        if lean:
+            cost_matrix = [array("d", bytes(8*(c_len+1))) for i in range(o_len+1)]
+            op_matrix = [array("i", bytes(4*(c_len+1))) for i in range(o_len+1)]
+        else:
+            cost_matrix = [[0.0]*(c_len+1) for i in range(o_len+1)]
+            op_matrix = [[O]*(c_len+1) for i in range(o_len+1)]
         for i in range(1, o_len+1):
             cost_matrix[i][0] = cost_matrix[i-1][0] + 1
-            op_matrix[i][0] = "D"
+            op_matrix[i][0] = D
         for j in range(1, c_len+1):
             cost_matrix[0][j] = cost_matrix[0][j-1] + 1
-            op_matrix[0][j] = "I"
+            op_matrix[0][j] = I
         for i in range(o_len):
+            sub_row = sub_matrix[i].tolist()
             for j in range(c_len):
-                if orig[i].orth == cor[j].orth:
+                if o_orth[i] == c_orth[j]:
                     cost_matrix[i+1][j+1] = cost_matrix[i][j]
-                    op_matrix[i+1][j+1] = "M"
+                    op_matrix[i+1][j+1] = M
                 else:
                     del_cost = cost_matrix[i][j+1] + 1
                     ins_cost = cost_matrix[i+1][j] + 1
                     trans_cost = float("inf")
 
-                    sub_cost = cost_matrix[i][j] + self.get_sub_cost(orig[i], cor[j])
+                    sub_cost = cost_matrix[i][j] + sub_row[j]
+                    # Extend the candidate transposition one token pair per
+                    # step, keeping a running multiset difference of the two
+                    # windows; they are permutations of each other when no
+                    # word is left unbalanced.
                     k = 1
-                    while i-k >= 0 and j-k >= 0 and cost_matrix[i-k+1][j-k+1] != cost_matrix[i-k][j-k]:
-                        if sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
+                    balance = None
+                    while i-k >= 0 and j-k >= 0 and k < max_k and cost_matrix[i-k+1][j-k+1] != cost_matrix[i-k][j-k]:
+                        if balance is None:
+                            balance = {o_low[i]: 1}
+                            balance[c_low[j]] = balance.get(c_low[j], 0) - 1
+                            unbalanced = 2 if balance[c_low[j]] else 0
+                        word = o_low[i-k]
+                        count = balance.get(word, 0)
+                        balance[word] = count + 1
+                        if count == 0: unbalanced += 1
+                        elif count == -1: unbalanced -= 1
+                        word = c_low[j-k]
+                        count = balance[word] if word in balance else 0
+                        balance[word] = count - 1
+                        if count == 0: unbalanced += 1
+                        elif count == 1: unbalanced -= 1
+                        if not unbalanced:
                             trans_cost = cost_matrix[i-k][j-k] + k
                             break
                         k += 1
+                    probes += k - 1
 
                     costs = [trans_cost, sub_cost, ins_cost, del_cost]
                     l = costs.index(min(costs))
                     cost_matrix[i+1][j+1] = costs[l]
-                    if   l == 0: op_matrix[i+1][j+1] = "T"+str(k+1)
-                    elif l == 1: op_matrix[i+1][j+1] = "S"
-                    elif l == 2: op_matrix[i+1][j+1] = "I"
-                    else: op_matrix[i+1][j+1] = "D"
-
-        self.cost_matrix = cost_matrix
-        self.op_matrix = op_matrix
+                    if   l == 0: op_matrix[i+1][j+1] = -(k+1)
+                    elif l == 1: op_matrix[i+1][j+1] = S
+                    elif l == 2: op_matrix[i+1][j+1] = I
+                    else: op_matrix[i+1][j+1] = D
+        if metrics.enabled:
+            metrics.incr("align.dp_cells", o_len*c_len)
+            metrics.incr("align.transposition_probes", probes)
+        return cost_matrix, op_matrix
 
-        i = len(op_matrix)-1
-        j = len(op_matrix[0])-1
+    def backtrace(self, op_matrix, o_start, o_end, c_start, c_end):
+        i = o_end - o_start
+        j = c_end - c_start
         align_seq = []
         while i + j != 0:
             op = op_matrix[i][j]
-            if op in {"M", "S"}:
-                align_seq.append((op, i-1, i, j-1, j))
+            o = o_start + i
+            c = c_start + j
+            if op == M or op == S:
+                align_seq.append((OPS[op], o-1, o, c-1, c))
                 i -= 1
                 j -= 1
-            elif op == "D":
-                align_seq.append((op, i-1, i, j, j))
+            elif op == D:
+                align_seq.append(("D", o-1, o, c, c))
                 i -= 1
-            elif op == "I":
-                align_seq.append((op, i, i, j-1, j))
+            elif op == I:
+                align_seq.append(("I", o, o, c-1, c))
                 j -= 1
             else:
-                k = int(op[1:])
-                align_seq.append((op, i-k, i, j-k, j))
+                k = -op
+                align_seq.append(("T"+str(k), o-k, o, c-k, c))
                 i -= k
                 j -= k
         align_seq.reverse()
-        self.align_seq = align_seq
+        return align_seq
+
+    def split_window(self, o_start, o_end, c_start, c_end, max_cells):
+        # Hirschberg-style divide and conquer: the middle row of orig is
+        # paired with the cor column that minimises forward plus backward
+        # edit cost, and both halves are split again until each block fits
+        # in max_cells. Only two cost rows are alive at a time. Transpositions
+        # cannot cross a block boundary, so this is reserved for inputs too
+        # large for the full matrices.
+        blocks = []
+        stack = [(o_start, o_end, c_start, c_end)]
+        while stack:
+            o0, o1, c0, c1 = stack.pop()
+            if (o1-o0)*(c1-c0) <= max_cells or o1-o0 < 2:
+                blocks.append((o0, o1, c0, c1))
+                continue
+            mid = (o0+o1)//2
+            forward = self._last_cost_row(range(o0, mid), c0, c1, False)
+            backward = self._last_cost_row(range(o1-1, mid-1, -1), c0, c1, True)
+            split = c0 + int(np.argmin(forward + backward[::-1]))
+            stack.append((mid, o1, split, c1))
+            stack.append((o0, mid, c0, split))
+        return blocks
+
+    def _last_cost_row(self, rows, c_start, c_end, reverse):
+        # Last row of the substitution/insertion/deletion cost matrix between
+        # the given orig rows and cor[c_start:c_end], computed one vectorised
+        # row at a time; insertion runs are resolved with a running minimum.
+        width = c_end - c_start
+        steps = np.arange(width+1, dtype=np.float64)
+        prev = steps.copy()
+        for i in rows:
+            sub_cost = self.get_sub_cost_matrix(i, i+1, c_start, c_end)[0]
+            if reverse:
+                sub_cost = sub_cost[::-1]
+            best = np.empty(width+1)
+            best[0] = prev[0] + 1
+            best[1:] = np.minimum(prev[:-1] + sub_cost, prev[1:] + 1)
+            prev = np.minimum.accumulate(best - steps) + steps
+        return prev
+
+    def get_sub_cost_matrix(self, o_start=0, o_end=None, c_start=0, c_end=None):
+        # Bulk equivalent of get_sub_cost for every (orig, cor) token pair
+        # in the given window.
+        o = self.orig_feats
+        c = self.cor_feats
+        o_end = len(o) if o_end is None else o_end
+        c_end = len(c) if c_end is None else c_end
+        if o_start == o_end or c_start == c_end:
+            return np.zeros((o_end-o_start, c_end-c_start))
+        char_cost = process.cdist(o.text[o_start:o_end], c.text[c_start:c_end], scorer=Indel.normalized_distance, dtype=np.float64)
+        o_lemma = o.column(LEMMA)[o_start:o_end]
+        c_lemma = c.column(LEMMA)[c_start:c_end]
+        lemma_cost = np.where(o_lemma[:, None] == c_lemma[None, :], 0, 0.499)
+        o_pos = o.column(POS_ATTR)[o_start:o_end]
+        c_pos = c.column(POS_ATTR)[c_start:c_end]
+        open_ids = list(self._open_pos)
+        both_open = np.isin(o_pos, open_ids)[:, None] & np.isin(c_pos, open_ids)[None, :]
+        pos_cost = np.where(o_pos[:, None] == c_pos[None, :], 0, np.where(both_open, 0.25, 0.5))
+        sub_cost = lemma_cost + pos_cost + char_cost
+        o_low = o.column(LOWER)[o_start:o_end]
+        c_low = c.column(LOWER)[c_start:c_end]
+        sub_cost[o_low[:, None] == c_low[None, :]] = 0
+        return sub_cost
 
     def get_rule_edits(self):
         edits = []
@@ -94,50 +293,15 @@ class Alignment:
             if op == "M": continue
             elif op == "T":
                 for seq in group:
-                    edits.append(Edit(self.orig, self.cor, seq[1:]))
+                    edits.append(Edit(self.orig, self.cor, seq[1:], o_feats=self.orig_feats, c_feats=self.cor_feats))
             else:
                 processed = self.process_seq(group)
                 for seq in processed:
-                    edits.append(Edit(self.orig, self.cor, seq[1:]))
+                    edits.append(Edit(self.orig, self.cor, seq[1:], o_feats=self.orig_feats, c_feats=self.cor_feats))
         return edits
 
     def process_seq(self, seq):
-        if len(seq) <= 1: return seq
-        ops = [op[0] for op in seq]
-        if set(ops) == {"D"} or set(ops) == {"I"}: return merge_edits(seq)
-        content = False
-        combos = list(combinations(range(0, len(seq)), 2))
-        combos.sort(key = lambda x: x[1]-x[0], reverse=True)
-        for start, end in combos:
-            if "S" not in ops[start:end+1]: continue
-            o = self.orig[seq[start][1]:seq[end][2]]
-            c = self.cor[seq[start][3]:seq[end][4]]
-            if start == 0 and (o[0].tag_ == "POS" or c[0].tag_ == "POS"):
-                return [seq[0]] + self.process_seq(seq[1:])
-            if o[-1].tag_ == "POS" or c[-1].tag_ == "POS":
-                return self.process_seq(seq[:end-1]) + merge_edits(seq[end-1:end+1]) + self.process_seq(seq[end+1:])
-            if o[-1].lower == c[-1].lower:
-                if start == 0 and ((len(o) == 1 and c[0].text[0].isupper()) or (len(c) == 1 and o[0].text[0].isupper())):
-                    return merge_edits(seq[start:end+1]) + self.process_seq(seq[end+1:])
-                if (len(o) > 1 and is_punct(o[-2])) or (len(c) > 1 and is_punct(c[-2])):
-                    return self.process_seq(seq[:end-1]) + merge_edits(seq[end-1:end+1]) + self.process_seq(seq[end+1:])
-            s_str = sub("['-]", "", "".join([tok.lower_ for tok in o]))
-            t_str = sub("['-]", "", "".join([tok.lower_ for tok in c]))
-            if s_str == t_str:
-                return self.process_seq(seq[:start]) + merge_edits(seq[start:end+1]) + self.process_seq(seq[end+1:])
-            pos_set = set([tok.pos for tok in o]+[tok.pos for tok in c])
-            if len(o) != len(c) and (len(pos_set) == 1 or pos_set.issubset({POS.AUX, POS.PART, POS.VERB})):
-                return self.process_seq(seq[:start]) + merge_edits(seq[start:end+1]) + self.process_seq(seq[end+1:])
-            if end-start < 2:
-                if len(o) == len(c) == 2:
-                    return self.process_seq(seq[:start+1]) + self.process_seq(seq[start+1:])
-                if (ops[start] == "S" and char_cost(o[0], c[0]) > 0.75) or (ops[end] == "S" and char_cost(o[-1], c[-1]) > 0.75):
-                    return self.process_seq(seq[:start+1]) + self.process_seq(seq[start+1:])
-                if end == len(seq)-1 and ((ops[-1] in {"D", "S"} and o[-1].pos == POS.DET) or (ops[-1] in {"I", "S"} and c[-1].pos == POS.DET)):
-                    return self.process_seq(seq[:-1]) + [seq[-1]]
-            if not pos_set.isdisjoint(open_pos): content = True
-        if content: return merge_edits(seq)
-        else: return seq
+        return SeqMerger(self, seq).run()
 
     def get_sub_cost(self, o, c):
         if o.lower == c.lower: return 0
@@ -152,7 +316,140 @@ class Alignment:
     def __str__(self):
         orig = " ".join(["Orig:"]+[tok.text for tok in self.orig])
         cor = " ".join(["Cor:"]+[tok.text for tok in self.cor])
-        cost_matrix = "\n".join(["Cost Matrix:"]+[str(row) for row in self.cost_matrix])
-        op_matrix = "\n".join(["Operation Matrix:"]+[str(row) for row in self.op_matrix])
         seq = "Best alignment: "+str([a[0] for a in self.align_seq])
-        return "\n".join([orig, cor, cost_matrix, op_matrix, seq])
\ No newline at end of file
+        if self.cost_matrix is None:
+            return "\n".join([orig, cor, seq])
+        cost_matrix = "\n".join(["Cost Matrix:"]+[str(row.tolist()) for row in self.cost_matrix])
+        op_matrix = "\n".join(["Operation Matrix:"]+[str([OPS[op] if op >= 0 else "T"+str(-op) for op in row]) for row in self.op_matrix.tolist()])
+        return "\n".join([orig, cor, cost_matrix, op_matrix, seq])
+
+class SeqMerger:
+    # Applies the process_seq merging rules to one run of non-matching
+    # operations. A window of the run is a (lo, hi) pair of indices into the
+    # shared sequence rather than a list slice, the token features the rules
+    # test are read once for the run's token range, and every window's plan
+    # is memoized. Plans are lists of ("P", lo, hi) sub-windows to process,
+    # ("M", lo, hi) ranges to merge into one edit and ("R", lo, hi) ranges
+    # kept as they are, flattened with an explicit stack instead of recursion.
+    _verb_pos = {POS.AUX, POS.PART, POS.VERB}
+
+    def __init__(self, alignment, seq):
+        self.seq = seq
+        self.ops = [op[0] for op in seq]
+        self.plans = {}
+        self.s_count = self._prefix_count([op == "S" for op in self.ops])
+        self.d_count = self._prefix_count([op == "D" for op in self.ops])
+        self.i_count = self._prefix_count([op == "I" for op in self.ops])
+        if seq:
+            self.o = _RangeFeatures(alignment.orig_feats, seq[0][1], seq[-1][2])
+            self.c = _RangeFeatures(alignment.cor_feats, seq[0][3], seq[-1][4])
+
+    def run(self):
+        seq = self.seq
+        out = []
+        stack = [("P", 0, len(seq))]
+        while stack:
+            kind, lo, hi = stack.pop()
+            if kind == "P":
+                plan = self.plans.get((lo, hi))
+                if plan is None:
+                    plan = self.plans[(lo, hi)] = self.plan(lo, hi)
+                stack.extend(reversed(plan))
+            elif kind == "M":
+                if lo < hi:
+                    out.append(("X", seq[lo][1], seq[hi-1][2], seq[lo][3], seq[hi-1][4]))
+            else:
+                out.extend(seq[lo:hi])
+        if metrics.enabled:
+            metrics.incr("process_seq.calls")
+            metrics.incr("process_seq.plans", len(self.plans))
+            metrics.peak("process_seq.depth", self.depth())
+        return out
+
+    def depth(self):
+        # Depth of the plan tree, i.e. how deep the original recursive
+        # process_seq would have gone for this run.
+        depth = 0
+        stack = [((0, len(self.seq)), 1)]
+        while stack:
+            key, level = stack.pop()
+            depth = max(depth, level)
+            for kind, lo, hi in self.plans.get(key, ()):
+                if kind == "P":
+                    stack.append(((lo, hi), level+1))
+        return depth
+
+    def plan(self, lo, hi):
+        n = hi - lo
+        if n <= 1: return [("R", lo, hi)]
+        if self.d_count[hi]-self.d_count[lo] == n or self.i_count[hi]-self.i_count[lo] == n: return [("M", lo, hi)]
+        seq = self.seq
+        ops = self.ops
+        o = self.o
+        c = self.c
+        content = False
+        for length in range(n-1, 0, -1):
+            for start in range(lo, hi-length):
+                end = start + length
+                if self.s_count[end+1] == self.s_count[start]: continue
+                o0, o1 = seq[start][1] - o.offset, seq[end][2] - o.offset
+                c0, c1 = seq[start][3] - c.offset, seq[end][4] - c.offset
+                o_len = o1 - o0
+                c_len = c1 - c0
+                if start == lo and (o.poss[o0] or c.poss[c0]):
+                    return [("R", lo, lo+1), ("P", lo+1, hi)]
+                if o.poss[o1-1] or c.poss[c1-1]:
+                    return [("P", lo, end-1), ("M", end-1, end+1), ("P", end+1, hi)]
+                if o.lower[o1-1] == c.lower[c1-1]:
+                    if start == lo and ((o_len == 1 and c.upper[c0]) or (c_len == 1 and o.upper[o0])):
+                        return [("M", start, end+1), ("P", end+1, hi)]
+                    if (o_len > 1 and o.punct[o1-2]) or (c_len > 1 and c.punct[c1-2]):
+                        return [("P", lo, end-1), ("M", end-1, end+1), ("P", end+1, hi)]
+                if o.joined(o0, o1) == c.joined(c0, c1):
+                    return [("P", lo, start), ("M", start, end+1), ("P", end+1, hi)]
+                same_pos = o.run_end[o0] >= o1 and c.run_end[c0] >= c1 and o.pos[o0] == c.pos[c0]
+                if o_len != c_len and (same_pos or (o.other_count[o1] == o.other_count[o0] and c.other_count[c1] == c.other_count[c0])):
+                    return [("P", lo, start), ("M", start, end+1), ("P", end+1, hi)]
+                if length < 2:
+                    if o_len == c_len == 2:
+                        return [("P", lo, start+1), ("P", start+1, hi)]
+                    if (ops[start] == "S" and o.char_cost(o0, c, c0) > 0.75) or (ops[end] == "S" and o.char_cost(o1-1, c, c1-1) > 0.75):
+                        return [("P", lo, start+1), ("P", start+1, hi)]
+                    if end == hi-1 and ((ops[end] in {"D", "S"} and o.pos[o1-1] == POS.DET) or (ops[end] in {"I", "S"} and c.pos[c1-1] == POS.DET)):
+                        return [("P", lo, hi-1), ("R", hi-1, hi)]
+                if o.open_count[o1] != o.open_count[o0] or c.open_count[c1] != c.open_count[c0]: content = True
+        if content: return [("M", lo, hi)]
+        else: return [("R", lo, hi)]
+
+    @staticmethod
+    def _prefix_count(flags):
+        counts = [0]
+        for flag in flags:
+            counts.append(counts[-1] + flag)
+        return counts
+
+class _RangeFeatures:
+    # Token features for doc[start:end], indexed from 0, with prefix counts
+    # and same-POS run ends so that window tests in SeqMerger are O(1).
+    def __init__(self, feats, start, end):
+        self.offset = start
+        self.text = feats.text[start:end]
+        self.lower = feats.lower[start:end]
+        self.pos = feats.pos[start:end]
+        self.poss = [tag == "POS" for tag in feats.tag_[start:end]]
+        self.upper = [text[0].isupper() for text in self.text]
+        self.punct = feats.is_punct[start:end]
+        self.other_count = SeqMerger._prefix_count([pos not in SeqMerger._verb_pos for pos in self.pos])
+        self.open_count = SeqMerger._prefix_count([pos in open_pos for pos in self.pos])
+        self.run_end = [0]*len(self.pos)
+        for i in range(len(self.pos)-1, -1, -1):
+            self.run_end[i] = self.run_end[i+1] if i+1 < len(self.pos) and self.pos[i+1] == self.pos[i] else i+1
+        stripped = [sub("['-]", "", lower) for lower in feats.lower_[start:end]]
+        self.string = "".join(stripped)
+        self.string_offsets = SeqMerger._prefix_count(len(s) for s in stripped)
+
+    def joined(self, start, end):
+        return self.string[self.string_offsets[start]:self.string_offsets[end]]
+
+    def char_cost(self, i, other, j):
+        return 1-Indel.normalized_distance(self.text[i], other.text[j])
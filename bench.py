@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import random
+import sys
+import numpy as np
+import srsly
+from time import perf_counter
+import utils
+from alignment import Alignment
+from features import TokenFeatures
+from model import load
+from render import render
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_corpus.jsonl")
+STAGES = ("parse", "features", "align", "dp_fill", "backtrace", "rule_edits", "classify", "render")
+
+# Generated pair sets: sentence length, fraction of tokens edited and the
+# share of those edits that are local reorderings.
+SETS = {
+    "short": {"n": 500, "length": 10, "density": 0.1, "reorder": 0.0},
+    "long": {"n": 100, "length": 60, "density": 0.1, "reorder": 0.0},
+    "dense": {"n": 200, "length": 25, "density": 0.4, "reorder": 0.0},
+    "reorder": {"n": 200, "length": 25, "density": 0.2, "reorder": 0.5},
+}
+
+def read_corpus(path=CORPUS):
+    return [(record["original"], record["corrected"]) for record in srsly.read_jsonl(path)]
+
+def make_pairs(n, length, density, reorder, seed=0, vocab=None):
+    rand = random.Random(seed)
+    vocab = vocab or sorted({word for pair in read_corpus() for text in pair for word in text.split()})
+    pairs = []
+    for _ in range(n):
+        orig = [rand.choice(vocab) for _ in range(max(1, int(rand.gauss(length, length / 4))))]
+        cor = list(orig)
+        for _ in range(int(len(orig) * density + rand.random())):
+            i = rand.randrange(len(cor) + 1)
+            choice = rand.random()
+            if choice < reorder and len(cor) > 2:
+                i = min(i, len(cor) - 2)
+                k = rand.randint(2, min(3, len(cor) - i))
+                cor[i:i+k] = cor[i:i+k][::-1]
+            elif choice < reorder + (1 - reorder) / 3:
+                cor.insert(i, rand.choice(vocab))
+            elif cor and choice < reorder + 2 * (1 - reorder) / 3:
+                del cor[min(i, len(cor) - 1)]
+            elif cor:
+                cor[min(i, len(cor) - 1)] = rand.choice(vocab)
+        pairs.append((" ".join(orig), " ".join(cor)))
+    return pairs
+
+def run_set(nlp, pairs, batch_size=64):
+    # One timing sample per pair and stage. Parsing is batched, so its
+    # per-pair sample is the batch time spread evenly over the batch.
+    # dp_fill and backtrace re-run the full-window DP of the alignment.
+    utils.classify_cache.clear()
+    times = {stage: [] for stage in STAGES}
+    texts = [text for pair in pairs for text in pair]
+    docs = []
+    for start in range(0, len(texts), batch_size * 2):
+        batch = texts[start:start + batch_size * 2]
+        t0 = perf_counter()
+        docs.extend(nlp.pipe(batch, batch_size=batch_size * 2))
+        elapsed = (perf_counter() - t0) / (len(batch) / 2)
+        times["parse"].extend([elapsed] * (len(batch) // 2))
+    for orig, cor in zip(docs[::2], docs[1::2]):
+        t0 = perf_counter()
+        orig_feats = TokenFeatures(orig)
+        cor_feats = TokenFeatures(cor)
+        t1 = perf_counter()
+        alignment = Alignment(orig, cor, orig_feats, cor_feats)
+        t2 = perf_counter()
+        _, op_matrix = alignment.fill_window(0, len(orig), 0, len(cor))
+        t3 = perf_counter()
+        alignment.backtrace(op_matrix, 0, len(orig), 0, len(cor))
+        t4 = perf_counter()
+        edits = alignment.get_rule_edits()
+        t5 = perf_counter()
+        edits = [utils.classify(edit) for edit in edits]
+        t6 = perf_counter()
+        render(orig, edits)
+        t7 = perf_counter()
+        for stage, elapsed in zip(STAGES[1:], (t1-t0, t2-t1, t3-t2, t4-t3, t5-t4, t6-t5, t7-t6)):
+            times[stage].append(elapsed)
+    return times
+
+def summarise(times):
+    report = {}
+    for stage, samples in times.items():
+        samples = np.array(samples)
+        total = float(samples.sum())
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99]).tolist() if len(samples) else (0.0, 0.0, 0.0)
+        report[stage] = {"pairs_per_s": len(samples) / total if total else 0.0, "total_s": total,
+                         "p50_ms": p50 * 1000, "p90_ms": p90 * 1000, "p99_ms": p99 * 1000}
+    return report
+
+def run(nlp=None, sets=None, repeat=3, seed=0, batch_size=64):
+    # Each set is timed `repeat` times and the fastest run of every stage is
+    # kept, which filters out most scheduler and GC noise.
+    nlp = nlp or load()
+    sets = sets or list(SETS) + ["corpus"]
+    vocab = sorted({word for pair in read_corpus() for text in pair for word in text.split()})
+    results = {}
+    for name in sets:
+        pairs = read_corpus() if name == "corpus" else make_pairs(seed=seed, vocab=vocab, **SETS[name])
+        runs = [summarise(run_set(nlp, pairs, batch_size)) for _ in range(repeat)]
+        results[name] = {stage: min((r[stage] for r in runs), key=lambda s: s["total_s"]) for stage in STAGES}
+    return results
+
+def compare(results, baseline, threshold=0.2, metric="p50_ms"):
+    # Returns (set, stage, baseline, current) for every stage whose metric
+    # grew by more than `threshold` relative to the baseline.
+    regressions = []
+    for name, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if base and base[metric] and current[metric] > base[metric] * (1 + threshold):
+                regressions.append((name, stage, base[metric], current[metric]))
+    return regressions
+
+def format_report(results):
+    lines = ["%-8s %-10s %12s %10s %10s %10s" % ("set", "stage", "pairs/s", "p50 ms", "p90 ms", "p99 ms")]
+    for name, stages in results.items():
+        for stage, s in stages.items():
+            lines.append("%-8s %-10s %12.1f %10.3f %10.3f %10.3f" % (name, stage, s["pairs_per_s"], s["p50_ms"], s["p90_ms"], s["p99_ms"]))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each highlighting stage on generated and recorded pair sets.")
+    parser.add_argument("--model", dest="model_name", default=None)
+    parser.add_argument("--sets", nargs="+", choices=list(SETS) + ["corpus"], default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--save", default=None, help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", default=None, help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (default: 0.2)")
+    parser.add_argument("--metric", choices=["p50_ms", "p90_ms", "p99_ms", "total_s"], default="p50_ms")
+    args = parser.parse_args(argv)
+    results = run(load(args.model_name), args.sets, args.repeat, args.seed, args.batch_size)
+    print(format_report(results))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.metric)
+        for name, stage, base, current in regressions:
+            print("REGRESSION %s/%s %s: %.4f -> %.4f" % (name, stage, args.metric, base, current), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+import sqlite3
+import threading
+import spacy
+import srsly
+from collections import OrderedDict, deque
+from hashlib import sha1
+from time import time
+from spacy.tokens import DocBin
+
+# Bump when the edits or markup produced for the same parse change, so that
+# persisted results from older code are not served.
+RESULT_VERSION = 1
+
+def model_id(nlp):
+    return "_".join([nlp.meta.get("lang", ""), nlp.meta.get("name", ""), nlp.meta.get("version", "")])
+
+class LRUCache:
+    # get, put and clear hold a lock, so one cache (utils.classify_cache, a
+    # DocCache) can be shared by batches running on several threads.
+    def __init__(self, maxsize=4096, max_weight=None, weigh=None, on_evict=None):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.on_evict = on_evict
+        self.data = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.data:
+                self.weight -= self._weigh(self.data.pop(key))
+            self.data[key] = value
+            self.weight += self._weigh(value)
+            while len(self.data) > 1 and (len(self.data) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight)):
+                old_key, old_value = self.data.popitem(last=False)
+                self.weight -= self._weigh(old_value)
+                self.evictions += 1
+                if self.on_evict:
+                    self.on_evict(old_key, old_value)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.weight = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self.data), "weight": self.weight, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / total if total else 0.0}
+
+    def _weigh(self, value):
+        return self.weigh(value) if self.weigh else 1
+
+class DocCache:
+    # Drop-in replacement for an nlp object: parses are looked up by text and
+    # model identity, held in memory under an entry and token budget, and
+    # spilled to one small DocBin file per text under `path` when evicted.
+    # Already tokenized Docs are annotated without caching, and the
+    # tokenizer-only make_doc, vocab and meta come from the wrapped nlp.
+    def __init__(self, nlp, maxsize=4096, max_tokens=500000, path=None):
+        self.nlp = nlp
+        self.model = model_id(nlp)
+        self.path = path
+        self.memory = LRUCache(maxsize, max_tokens, len, self._spill if path else None)
+        self.disk_hits = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @property
+    def vocab(self):
+        return self.nlp.vocab
+
+    @property
+    def meta(self):
+        return self.nlp.meta
+
+    def make_doc(self, text):
+        return self.nlp.make_doc(text)
+
+    def __call__(self, text):
+        if not isinstance(text, str):
+            return self.nlp(text)
+        doc = self._lookup(text)
+        if doc is None:
+            doc = self.nlp(text)
+            self.memory.put(text, doc)
+        return doc
+
+    def pipe(self, texts, batch_size=64, n_process=1):
+        # Hits are looked up as the texts stream in and every miss goes
+        # through one nlp.pipe call, so its n_process workers start once.
+        # Results come back in input order: a hit waits for the misses
+        # before it to be parsed, and repeats of a text still being parsed
+        # share its Doc.
+        order = deque()
+        parsing = deque()
+        waiting = {}
+
+        def misses():
+            for text in texts:
+                if isinstance(text, str):
+                    if text in waiting:
+                        order.append(waiting[text])
+                        continue
+                    doc = self._lookup(text)
+                    if doc is not None:
+                        order.append([text, doc])
+                        continue
+                entry = [text, None]
+                order.append(entry)
+                parsing.append(entry)
+                if isinstance(text, str):
+                    waiting[text] = entry
+                yield text
+
+        for doc in self.nlp.pipe(misses(), batch_size=batch_size, n_process=n_process):
+            entry = parsing.popleft()
+            entry[1] = doc
+            if isinstance(entry[0], str):
+                del waiting[entry[0]]
+                self.memory.put(entry[0], doc)
+            while order and order[0][1] is not None:
+                yield order.popleft()[1]
+        while order:
+            yield order.popleft()[1]
+
+    def flush(self):
+        if self.path:
+            for text, doc in self.memory.data.items():
+                self._spill(text, doc)
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] -= self.disk_hits
+        total = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / total if total else 0.0
+        return stats
+
+    def _lookup(self, text):
+        doc = self.memory.get(text)
+        if doc is None and self.path:
+            doc = self._load(text)
+            if doc is not None:
+                self.disk_hits += 1
+                self.memory.put(text, doc)
+        return doc
+
+    def _file(self, text):
+        key = sha1("\0".join([self.model, text]).encode("utf8")).hexdigest()
+        return os.path.join(self.path, key[:2], key + ".spacy")
+
+    def _load(self, text):
+        filename = self._file(text)
+        if not os.path.exists(filename):
+            return None
+        for doc in DocBin().from_disk(filename).get_docs(self.nlp.vocab):
+            if doc.text == text:
+                return doc
+        return None
+
+    def _spill(self, text, doc):
+        filename = self._file(text)
+        if os.path.exists(filename):
+            return
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = filename + ".%d.tmp" % os.getpid()
+        DocBin(docs=[doc]).to_disk(tmp)
+        os.replace(tmp, filename)
+
+class ResultCache:
+    # Final results for (original, corrected) pairs in a SQLite file, keyed
+    # by a hash of both texts, the kind of result, the model, the spaCy
+    # version and RESULT_VERSION. Entries older than `ttl` seconds are
+    # ignored and purged; beyond max_entries the least recently used are
+    # evicted. SQLite's WAL mode and busy timeout make the file safe to
+    # share between processes on one host; each process (including forked
+    # workers) opens its own connection on first use.
+    def __init__(self, path, nlp, ttl=None, max_entries=1000000, purge_every=1000):
+        self.path = path
+        self.version = "\0".join([model_id(nlp), spacy.__version__, str(RESULT_VERSION)])
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+
+    def get(self, orig_text, cor_text, kind="markup"):
+        key = self.key(orig_text, cor_text, kind)
+        row = self.conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl is not None and row[1] < time() - self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.conn:
+            self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time(), key))
+        return srsly.json_loads(row[0])
+
+    def put(self, orig_text, cor_text, value, kind="markup"):
+        now = time()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (self.key(orig_text, cor_text, kind), srsly.json_dumps(value), now, now))
+        self.puts += 1
+        if self.puts % self.purge_every == 0:
+            self.purge()
+
+    def purge(self):
+        with self.conn:
+            if self.ttl is not None:
+                self.conn.execute("DELETE FROM results WHERE created < ?", (time() - self.ttl,))
+            excess = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)", (excess,))
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM results")
+
+    def stats(self):
+        total = self.hits + self.misses
+        size = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"size": size, "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def key(self, orig_text, cor_text, kind):
+        return sha1("\0".join([self.version, kind, orig_text, cor_text]).encode("utf8")).hexdigest()
+
+    @property
+    def conn(self):
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._pid = None
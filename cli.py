@@ -0,0 +1,118 @@
+import argparse
+import sys
+import srsly
+import fallback
+import fastpath
+import index
+import lazy
+from cache import ResultCache
+from model import load
+from pool import chunked, imap_ordered, prefork_imap
+from render import render
+
+FIELDS = ("type", "o_str", "o_start", "o_end", "c_str", "c_start", "c_end")
+
+_worker = {}
+
+def init_worker(model_name, output, batch_size, budget=None, max_cells=None, result_cache=None, cache_ttl=None, lazy=False):
+    _worker["nlp"] = index.warm(load(model_name))
+    _worker["output"] = output
+    _worker["batch_size"] = batch_size
+    _worker["budget"] = budget
+    _worker["max_cells"] = max_cells
+    _worker["lazy"] = lazy
+    _worker["cache"] = ResultCache(result_cache, _worker["nlp"], cache_ttl) if result_cache else None
+
+def process_chunk(records):
+    # Records taking the fast path or with a cached result skip parsing;
+    # the rest are parsed as one batch and, when computed at full quality,
+    # cached.
+    cache = _worker["cache"]
+    output = _worker["output"]
+    lines = [None] * len(records)
+    misses = []
+    for i, record in enumerate(records):
+        result = {"id": record.get("id")}
+        fast = fastpath.get_edits(record["original"], record["corrected"], _worker["nlp"])
+        if fast is not None:
+            mode = "fast"
+            value = index.annotations(fast[1]) if output == "edits" else render(*fast)
+        else:
+            mode = "full"
+            value = cache.get(record["original"], record["corrected"], output) if cache is not None else None
+        if value is None:
+            misses.append(i)
+            continue
+        if _worker["budget"] is not None or _worker["max_cells"] is not None:
+            result["mode"] = mode
+        result[output] = [dict(zip(FIELDS, edit)) for edit in value] if output == "edits" else value
+        lines[i] = srsly.json_dumps(result)
+    for i, orig, edits, mode in compute_edits(records, misses):
+        record = records[i]
+        result = {"id": record.get("id")}
+        if _worker["budget"] is not None or _worker["max_cells"] is not None:
+            result["mode"] = mode
+        if output == "edits":
+            value = index.annotations(edits)
+            result["edits"] = [dict(zip(FIELDS, edit)) for edit in value]
+        else:
+            value = result["markup"] = render(orig, edits)
+        if cache is not None and mode == "full":
+            cache.put(record["original"], record["corrected"], value, output)
+        lines[i] = srsly.json_dumps(result)
+    return lines
+
+def compute_edits(records, indices):
+    # Yields (index, orig, edits, mode) for the given records, either parsed
+    # lazily pair by pair or parsed in full as one batch.
+    nlp = _worker["nlp"]
+    if _worker["lazy"]:
+        for i in indices:
+            orig, edits = lazy.get_edits(records[i]["original"], records[i]["corrected"], nlp)
+            yield i, orig, edits, "lazy"
+        return
+    pairs = [(records[i]["original"], records[i]["corrected"]) for i in indices]
+    docs = index.iter_docs(pairs, batch_size=_worker["batch_size"], nlp=nlp)
+    for i, (orig, cor) in zip(indices, docs):
+        if _worker["budget"] is None and _worker["max_cells"] is None:
+            yield i, orig, index.get_edits(orig, cor), "full"
+        else:
+            yield (i, orig) + fallback.get_edits(orig, cor, _worker["budget"], _worker["max_cells"])
+
+def run(input="-", output="markup", model_name=None, workers=1, chunk_size=256, max_in_flight=None, batch_size=64, budget=None, max_cells=None,
+        prefork=False, max_tasks_per_child=None, result_cache=None, cache_ttl=None, lazy=False, out=None):
+    out = out or sys.stdout
+    chunks = chunked(srsly.read_jsonl(input), chunk_size)
+    initargs = (model_name, output, batch_size, budget, max_cells, result_cache, cache_ttl, lazy)
+    if workers <= 1:
+        init_worker(*initargs)
+        results = map(process_chunk, chunks)
+    elif prefork:
+        results = prefork_imap(process_chunk, chunks, workers, max_in_flight, init_worker, initargs, max_tasks_per_child)
+    else:
+        results = imap_ordered(process_chunk, chunks, workers, max_in_flight, init_worker, initargs, maxtasksperchild=max_tasks_per_child)
+    for lines in results:
+        for line in lines:
+            out.write(line + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Highlight (original, corrected) pairs read as JSONL.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file with original, corrected and id fields (default: stdin)")
+    parser.add_argument("--output", choices=["markup", "edits"], default="markup")
+    parser.add_argument("--model", dest="model_name", default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--max-in-flight", type=int, default=None, help="chunks queued ahead of the writer (default: 2 per worker)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--budget", type=float, default=None, help="seconds per pair after parsing; slower pairs fall back to cheaper modes")
+    parser.add_argument("--max-cells", type=int, default=None, help="cap on alignment DP cells per pair")
+    parser.add_argument("--prefork", action="store_true", help="load the model once and fork workers that share it copy-on-write")
+    parser.add_argument("--max-tasks-per-child", type=int, default=None, help="chunks a worker handles before it is replaced")
+    parser.add_argument("--result-cache", default=None, help="SQLite file caching results across runs and processes")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="seconds a cached result stays valid")
+    parser.add_argument("--lazy", action="store_true", help="tag and parse only the sentences with content edits (ignores --budget and --max-cells)")
+    args = parser.parse_args(argv)
+    run(**vars(args))
+
+if __name__ == "__main__":
+    main()
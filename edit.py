@@ -1,37 +1,167 @@
+import numpy as np
+import srsly
+from array import array
+from features import TokenFeatures
+
+# Edit types are interned per process; Edit.type_id indexes TYPES.
+TYPES = ["NA"]
+TYPE_IDS = {"NA": 0}
+
+def type_id(name):
+    id = TYPE_IDS.get(name)
+    if id is None:
+        id = TYPE_IDS[name] = len(TYPES)
+        TYPES.append(name)
+    return id
+
 class Edit:
-    def __init__(self, orig, cor, edit, type="NA"):
+    # Only token offsets, the type id and the two sides' feature tables are
+    # stored; Spans and strings are built on access.
+    __slots__ = ("o_feats", "c_feats", "o_start", "o_end", "c_start", "c_end", "type_id")
+
+    def __init__(self, orig, cor, edit, type="NA", o_feats=None, c_feats=None):
+        self.o_feats = TokenFeatures(orig) if o_feats is None else o_feats
+        self.c_feats = TokenFeatures(cor) if c_feats is None else c_feats
         self.o_start = edit[0]
         self.o_end = edit[1]
-        self.o_toks = orig[self.o_start:self.o_end]
-        self.o_str = self.o_toks.text if self.o_toks else ""
         self.c_start = edit[2]
         self.c_end = edit[3]
-        self.c_toks = cor[self.c_start:self.c_end]
-        self.c_str = self.c_toks.text if self.c_toks else ""
-        self.type = type
+        self.type_id = type_id(type)
+
+    @property
+    def type(self):
+        return TYPES[self.type_id]
+
+    @type.setter
+    def type(self, name):
+        self.type_id = type_id(name)
+
+    @property
+    def o_toks(self):
+        return self.o_feats.doc[self.o_start:self.o_end]
+
+    @property
+    def c_toks(self):
+        return self.c_feats.doc[self.c_start:self.c_end]
+
+    @property
+    def o_str(self):
+        return span_text(self.o_feats, self.o_start, self.o_end)
+
+    @property
+    def c_str(self):
+        return span_text(self.c_feats, self.c_start, self.c_end)
 
     def minimise(self):
-        while self.o_toks and self.c_toks and self.o_toks[0].text == self.c_toks[0].text:
-            self.o_toks = self.o_toks[1:]
-            self.c_toks = self.c_toks[1:]
+        o_orth = self.o_feats.orth
+        c_orth = self.c_feats.orth
+        while self.o_start < self.o_end and self.c_start < self.c_end and o_orth[self.o_start] == c_orth[self.c_start]:
             self.o_start += 1
             self.c_start += 1
-        while self.o_toks and self.c_toks and self.o_toks[-1].text == self.c_toks[-1].text:
-            self.o_toks = self.o_toks[:-1]
-            self.c_toks = self.c_toks[:-1]
+        while self.o_start < self.o_end and self.c_start < self.c_end and o_orth[self.o_end-1] == c_orth[self.c_end-1]:
             self.o_end -= 1
             self.c_end -= 1
-        self.o_str = self.o_toks.text if self.o_toks else ""
-        self.c_str = self.c_toks.text if self.c_toks else ""
         return self
 
     def to_m2(self, id=0):
         span = " ".join(["A", str(self.o_start), str(self.o_end)])
-        cor_toks_str = " ".join([tok.text for tok in self.c_toks])
+        cor_toks_str = " ".join(self.c_feats.text[self.c_start:self.c_end])
         return "|||".join([span, self.type, cor_toks_str, "REQUIRED", "-NONE-", str(id)])
 
     def __str__(self):
         orig = "Orig: "+str([self.o_start, self.o_end, self.o_str])
         cor = "Cor: "+str([self.c_start, self.c_end, self.c_str])
         type = "Type: "+repr(self.type)
-        return ", ".join([orig, cor, type])
\ No newline at end of file
+        return ", ".join([orig, cor, type])
+
+def span_text(feats, start, end):
+    if start == end:
+        return ""
+    return feats.string[feats.idx[start]:feats.idx[end-1]+len(feats.text[end-1])]
+
+class EditBatch:
+    # Column store for the edits of many sentences. Offsets and type codes
+    # live in typed arrays and the edits of sentence i are rows
+    # bounds[i]:bounds[i+1]. Type codes index the batch's own `types` table,
+    # so a batch stays meaningful when pickled to another process. Sentences
+    # added without an id are numbered by their position in the batch, also
+    # after extend().
+    columns = ("o_start", "o_end", "c_start", "c_end")
+
+    def __init__(self):
+        self.ids = []
+        self.sentences = []
+        self.bounds = array("q", [0])
+        self.o_start = array("i")
+        self.o_end = array("i")
+        self.c_start = array("i")
+        self.c_end = array("i")
+        self.type_code = array("H")
+        self.o_str = []
+        self.c_str = []
+        self.c_toks = []
+        self.types = []
+        self.type_codes = {}
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def add(self, orig, edits, id=None):
+        self.ids.append(id)
+        self.sentences.append(" ".join(tok.text for tok in orig))
+        for edit in edits:
+            self.o_start.append(edit.o_start)
+            self.o_end.append(edit.o_end)
+            self.c_start.append(edit.c_start)
+            self.c_end.append(edit.c_end)
+            self.type_code.append(self._code(edit.type))
+            self.o_str.append(edit.o_str)
+            self.c_str.append(edit.c_str)
+            self.c_toks.append(" ".join(edit.c_feats.text[edit.c_start:edit.c_end]))
+        self.bounds.append(len(self.o_start))
+
+    def extend(self, other):
+        offset = len(self.o_start)
+        self.ids.extend(other.ids)
+        self.sentences.extend(other.sentences)
+        self.bounds.extend(bound + offset for bound in other.bounds[1:])
+        for column in self.columns:
+            getattr(self, column).extend(getattr(other, column))
+        self.type_code.extend(self._code(other.types[code]) for code in other.type_code)
+        self.o_str.extend(other.o_str)
+        self.c_str.extend(other.c_str)
+        self.c_toks.extend(other.c_toks)
+
+    def edits(self, i):
+        for row in range(self.bounds[i], self.bounds[i+1]):
+            yield (self.types[self.type_code[row]], self.o_str[row], self.o_start[row], self.o_end[row],
+                   self.c_str[row], self.c_start[row], self.c_end[row])
+
+    def to_numpy(self):
+        # Zero-copy views of the typed columns plus each row's sentence index.
+        arrays = {column: np.frombuffer(getattr(self, column), dtype=np.intc) for column in self.columns}
+        arrays["type_code"] = np.frombuffer(self.type_code, dtype=np.uint16)
+        arrays["sentence"] = np.repeat(np.arange(len(self.sentences)), np.diff(np.frombuffer(self.bounds, dtype=np.int64)))
+        return arrays
+
+    def to_jsonl(self):
+        fields = ("type", "o_str", "o_start", "o_end", "c_str", "c_start", "c_end")
+        for i, id in enumerate(self.ids):
+            yield srsly.json_dumps({"id": i if id is None else id, "edits": [dict(zip(fields, edit)) for edit in self.edits(i)]})
+
+    def to_m2(self, annotator=0):
+        for i, sentence in enumerate(self.sentences):
+            lines = ["S " + sentence]
+            for row in range(self.bounds[i], self.bounds[i+1]):
+                span = " ".join(["A", str(self.o_start[row]), str(self.o_end[row])])
+                lines.append("|||".join([span, self.types[self.type_code[row]], self.c_toks[row], "REQUIRED", "-NONE-", str(annotator)]))
+            if len(lines) == 1:
+                lines.append("|||".join(["A -1 -1", "noop", "-NONE-", "REQUIRED", "-NONE-", str(annotator)]))
+            yield "\n".join(lines) + "\n"
+
+    def _code(self, name):
+        code = self.type_codes.get(name)
+        if code is None:
+            code = self.type_codes[name] = len(self.types)
+            self.types.append(name)
+        return code
@@ -0,0 +1,65 @@
+from alignment import Alignment, lcs_blocks, lcs_windows
+from edit import Edit
+from features import TokenFeatures
+from sentences import sentence_windows
+from utils import classify
+
+# Cheaper modes, tried in order until one fits the budget. "full" is the
+# normal alignment; "anchored" only aligns the windows between long LCS
+# anchors; "sentence" aligns matched sentence pairs separately; "coarse" turns each
+# differing LCS block into one merged edit; "unclassified" is coarse
+# without classification, typed M:, U: or R:UNCLASSIFIED.
+MODES = ("full", "anchored", "sentence", "coarse", "unclassified")
+
+# Rough unit costs on a single core, from bench.py: one DP cell, one token
+# of the pair walked by the alignment outside the DP, one step of the
+# process_seq window search (quadratic in the length of a differing run)
+# and classifying one edited token.
+seconds_per_cell = 2e-6
+seconds_per_token = 1e-5
+seconds_per_merge_step = 1e-6
+seconds_per_edit_token = 1e-5
+
+def plan(orig, cor, orig_feats, cor_feats, budget=None, max_cells=None):
+    # Picks the first mode whose estimated cost fits, from token counts and
+    # the token-level LCS only; no DP work is done here. Returns
+    # (mode, windows, blocks) where blocks are the differing LCS blocks.
+    blocks = lcs_blocks(orig_feats, cor_feats)
+    merge = sum(max(o1-o0, c1-c0)**2 for o0, o1, c0, c1 in blocks) * seconds_per_merge_step
+    edit_tokens = sum(max(o1-o0, c1-c0) for o0, o1, c0, c1 in blocks) * seconds_per_edit_token
+    for mode in MODES:
+        if mode == "full":
+            windows = [(0, len(orig_feats), 0, len(cor_feats), False)]
+        elif mode == "anchored":
+            windows = lcs_windows(orig_feats, cor_feats)
+        elif mode == "sentence":
+            windows = sentence_windows(orig, cor, orig_feats, cor_feats)
+        else:
+            windows = []
+        cells = sum((o1-o0)*(c1-c0) for o0, o1, c0, c1, equal in windows if not equal)
+        seconds = cells * seconds_per_cell + (edit_tokens if mode != "unclassified" else 0)
+        if windows:
+            seconds += merge + (len(orig_feats) + len(cor_feats)) * seconds_per_token
+        if (budget is None or seconds <= budget) and (max_cells is None or cells <= max_cells):
+            return mode, windows, blocks
+    return "unclassified", [], blocks
+
+def get_edits(orig, cor, budget=None, max_cells=None, orig_feats=None, cor_feats=None):
+    # Returns (edits, mode) for the best mode that fits `budget` seconds
+    # and/or `max_cells` DP cells.
+    orig_feats = TokenFeatures(orig) if orig_feats is None else orig_feats
+    cor_feats = TokenFeatures(cor) if cor_feats is None else cor_feats
+    mode, windows, blocks = plan(orig, cor, orig_feats, cor_feats, budget, max_cells)
+    if mode == "full":
+        edits = Alignment(orig, cor, orig_feats, cor_feats).get_rule_edits()
+    elif mode in ("anchored", "sentence"):
+        edits = Alignment(orig, cor, orig_feats, cor_feats, lean=True, windows=windows).get_rule_edits()
+    else:
+        edits = [Edit(orig, cor, block, unclassified_type(block), orig_feats, cor_feats) for block in blocks]
+    if mode != "unclassified":
+        edits = [classify(edit) for edit in edits]
+    return edits, mode
+
+def unclassified_type(block):
+    o0, o1, c0, c1 = block
+    return ("M:" if o0 == o1 else "U:" if c0 == c1 else "R:") + "UNCLASSIFIED"
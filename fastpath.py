@@ -0,0 +1,53 @@
+from string import punctuation, whitespace
+from alignment import Alignment
+from features import TokenFeatures
+from render import render
+
+_strip = str.maketrans("", "", punctuation + whitespace)
+
+def is_trivial(orig_text, cor_text):
+    # True when the texts differ at most in whitespace, case and ASCII
+    # punctuation; a character-level test run before any parsing.
+    return orig_text.translate(_strip).lower() == cor_text.translate(_strip).lower()
+
+def markup(orig_text, cor_text, nlp):
+    # Identical texts come back unchanged without touching the pipeline.
+    if orig_text == cor_text:
+        return orig_text
+    found = get_edits(orig_text, cor_text, nlp)
+    return render(*found) if found is not None else None
+
+def get_edits(orig_text, cor_text, nlp):
+    # Edits for trivially different pairs from tokenizer-only Docs: case and
+    # spacing changes become R:ORTH, punctuation changes M:/U:/R:PUNCT and
+    # added or removed whitespace tokens M:/U:SPACE.
+    # Returns (orig, edits), or None when the pair needs the full pipeline.
+    if orig_text != cor_text and not is_trivial(orig_text, cor_text):
+        return None
+    orig = nlp.make_doc(orig_text)
+    if orig_text == cor_text:
+        return orig, []
+    cor = nlp.make_doc(cor_text)
+    o = TokenFeatures(orig)
+    c = TokenFeatures(cor)
+    edits = Alignment(orig, cor, o, c, anchored=True).get_rule_edits()
+    for edit in edits:
+        edit.type = get_type(o, edit.o_start, edit.o_end, c, edit.c_start, edit.c_end)
+        if edit.type == "NA":
+            return None
+    return orig, edits
+
+def get_type(o, o0, o1, c, c0, c1):
+    texts = o.text[o0:o1] + c.text[c0:c1]
+    if any(text.isspace() for text in texts):
+        # Whitespace tokens are tagged _SP and typed SPACE by the full
+        # classifier; anything but a plain insertion or deletion of them is
+        # left to it.
+        if all(text.isspace() for text in texts) and (o0 == o1 or c0 == c1):
+            return ("M:" if o0 == o1 else "U:") + "SPACE"
+        return "NA"
+    if all(text.translate(_strip) == "" for text in texts):
+        return ("M:" if o0 == o1 else "U:" if c0 == c1 else "R:") + "PUNCT"
+    if o0 < o1 and c0 < c1 and "".join(o.lower_[o0:o1]) == "".join(c.lower_[c0:c1]):
+        return "R:ORTH"
+    return "NA"
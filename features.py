@@ -0,0 +1,85 @@
+import numpy as np
+import spacy.parts_of_speech as POS
+from functools import cached_property
+from string import punctuation
+from spacy.attrs import DEP, HEAD, LEMMA, LOWER, ORTH, POS as POS_ATTR, TAG
+
+class TokenFeatures:
+    # Per-Doc token attributes read in bulk with Doc.to_array, so that
+    # alignment and classification index plain lists instead of crossing
+    # into Cython for every Token attribute. Integer columns are filled up
+    # front; string views and derived flags are built on first use. One
+    # instance can be shared by every Alignment and Edit over the same Doc.
+    attrs = [ORTH, LOWER, LEMMA, POS_ATTR, TAG, DEP, HEAD]
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.array = doc.to_array(self.attrs)
+        if len(doc):
+            self.orth, self.lower, self.lemma, self.pos, self.tag, self.dep, _ = self.array.T.tolist()
+            offsets = self.array[:, self.attrs.index(HEAD)].astype(np.int64)
+            self.head = (offsets + np.arange(len(doc))).tolist()
+        else:
+            self.orth, self.lower, self.lemma, self.pos, self.tag, self.dep, self.head = [], [], [], [], [], [], []
+        self.text = [tok.text for tok in doc]
+
+    def column(self, attr):
+        return self.array[:, self.attrs.index(attr)]
+
+    def __len__(self):
+        return len(self.text)
+
+    @cached_property
+    def string(self):
+        # Doc.text rebuilds the string from its tokens on every access.
+        return self.doc.text
+
+    @cached_property
+    def idx(self):
+        return [tok.idx for tok in self.doc]
+
+    @cached_property
+    def lower_(self):
+        return self._strings(self.lower)
+
+    @cached_property
+    def tag_(self):
+        return self._strings(self.tag)
+
+    @cached_property
+    def dep_(self):
+        return self._strings(self.dep)
+
+    @cached_property
+    def coarse(self):
+        # Coarse POS from utils.pos_map; tags it does not know map to "X".
+        from utils import pos_map
+        return [pos_map.get(tag, "X") for tag in self.tag_]
+
+    def signature(self, start, end):
+        # Everything the classification rules read about the tokens
+        # themselves, as hashable ids.
+        return tuple(zip(self.orth[start:end], self.tag[start:end], self.pos[start:end], self.dep[start:end], self.lemma[start:end]))
+
+    @cached_property
+    def is_punct(self):
+        return [pos == POS.PUNCT or text in punctuation for pos, text in zip(self.pos, self.text)]
+
+    @cached_property
+    def is_aux(self):
+        return [dep.startswith("aux") for dep in self.dep_]
+
+    @cached_property
+    def _children(self):
+        children = [[] for i in range(len(self.head))]
+        for i, head in enumerate(self.head):
+            if head != i:
+                children[head].append(i)
+        return children
+
+    def children(self, i):
+        return self._children[i]
+
+    def _strings(self, ids):
+        strings = self.doc.vocab.strings
+        return [strings[i] for i in ids]
@@ -1,62 +1,159 @@
-import spacy
-from spacy.tokens import Doc
-from itertools import combinations, groupby
-from rapidfuzz.distance import Indel
+import fallback
+import fastpath
+import lazy
+import metrics
+import sentences
+from collections import deque
+from itertools import islice
+from time import perf_counter
 from alignment import Alignment
+from edit import EditBatch
+from features import TokenFeatures
+from model import load
+from render import render
 from utils import classify
 
-nlp = spacy.load('en_core_web_sm')
+# With a `budget` in seconds and/or a `max_cells` DP cost cap, handler and
+# the batch functions fall back to cheaper alignment modes for inputs that
+# would not fit (see fallback.py) and return (markup, mode) instead of markup.
+# Pairs that are identical or differ only in case, spacing and punctuation
+# take fastpath.markup without tagging or parsing (mode "fast").
+# A cache.ResultCache passed as `cache` short-circuits pairs seen before;
+# only full-quality results are stored.
+def handler(orig_text, cor_text, nlp=None, budget=None, max_cells=None, cache=None):
+  budgeted = budget is not None or max_cells is not None
+  nlp = nlp or load()
+  fast = fastpath.markup(orig_text, cor_text, nlp)
+  if fast is not None:
+    return (fast, "fast") if budgeted else fast
+  cached = cache.get(orig_text, cor_text) if cache is not None else None
+  if cached is not None:
+    return (cached, "full") if budgeted else cached
+  start = perf_counter() if metrics.enabled or budgeted else None
+  with metrics.timer("parse"):
+    orig = nlp(orig_text)
+    cor = nlp(cor_text)
+  if budgeted:
+    remaining = None if budget is None else budget - (perf_counter() - start)
+    result = markup_within(orig, cor, remaining, max_cells)
+    text, mode = result
+  else:
+    result = text = markup(orig, cor)
+    mode = "full"
+  if metrics.enabled:
+    metrics.record_pair(perf_counter() - start, orig_text, cor_text)
+  if cache is not None and mode == "full":
+    cache.put(orig_text, cor_text, text)
+  return result
 
-def handler():
-  orig_text = 'what'
-  cor_text = '?what'
+def handle_document(orig_text, cor_text, nlp=None, workers=1, pool=None):
+  # For paragraphs and essays: sentences are matched up and aligned pair by
+  # pair (see sentences.py) instead of as one token sequence.
+  nlp = nlp or load()
   orig = nlp(orig_text)
   cor = nlp(cor_text)
-  alignment = Alignment(orig, cor)
-  edits = alignment.get_rule_edits()
-
-  edit_annotations = []
-  for edit in edits:
-    edit = classify(edit)
-    edit_annotations.append((edit.type[2:], edit.o_str, edit.o_start, edit.o_end,  edit.c_str, edit.c_start, edit.c_end))
-
-  orig_tokens = orig_text.split()
-  ignore_indexes = []
-
-  for edit_annotation in edit_annotations:
-    edit_type = edit_annotation[0]
-    edit_str_start = edit_annotation[1]
-    edit_spos = edit_annotation[2]
-    edit_epos = edit_annotation[3]
-    edit_str_end = edit_annotation[4]
-    print(edit_type, edit_str_start,  edit_spos, edit_epos, edit_str_end)
-    for i in range(edit_spos+1, edit_epos):
-      ignore_indexes.append(i)
-    if edit_str_start == "":
-        if edit_spos - 1 >= 0:
-            new_edit_str = orig_tokens[edit_spos - 1]
-            edit_spos -= 1
-        else:
-            new_edit_str = orig_tokens[edit_spos + 1]
-            edit_spos += 1
-        if edit_type == "PUNCT":
-          st = "<a type='" + edit_type + "' edit='" + edit_str_end + "'>" + new_edit_str + "</a>"
-        else:
-          st = "<a type='" + edit_type + "' edit='" + new_edit_str + " " + edit_str_end + "'>" + new_edit_str + "</a>"
-        orig_tokens[edit_spos] = st
-    elif edit_str_end == "":
-      st = "<d type='" + edit_type + "' edit=''>" + edit_str_start + "</d>"
-      orig_tokens[edit_spos] = st
-    else:
-      st = "<c type='" + edit_type + "' edit='" + edit_str_end + "'>" + edit_str_start + "</c>"
-      orig_tokens[edit_spos] = st
-
-  for i in sorted(ignore_indexes, reverse=True):
-    del(orig_tokens[i])
-
-  result = " ".join(orig_tokens)
+  return document_markup(orig, cor, workers, pool)
 
-  return result
+def handle_lazy(orig_text, cor_text, nlp=None):
+  # For long texts with few corrections: only the sentences holding content
+  # edits are tagged and parsed (see lazy.py).
+  nlp = nlp or load()
+  if orig_text == cor_text:
+    return orig_text
+  orig, edits = lazy.get_edits(orig_text, cor_text, nlp)
+  with metrics.timer("render"):
+    return render(orig, edits)
+
+def handle_batch(pairs, batch_size=64, n_process=1, nlp=None, budget=None, max_cells=None):
+  return list(iter_batch(pairs, batch_size=batch_size, n_process=n_process, nlp=nlp, budget=budget, max_cells=max_cells))
+
+def iter_batch(pairs, batch_size=64, n_process=1, nlp=None, budget=None, max_cells=None):
+  # Parsing is batched, so here the budget covers each pair's work after
+  # parsing. Fast-path results wait in `pending`, in input order, for the
+  # parsed pairs ahead of them; None marks a pair sent to nlp.pipe.
+  nlp = nlp or load()
+  budgeted = budget is not None or max_cells is not None
+  pending = deque()
+  def texts():
+    for pair in pairs:
+      fast = fastpath.markup(pair[0], pair[1], nlp)
+      pending.append(fast if fast is None or not budgeted else (fast, "fast"))
+      if fast is None:
+        yield pair[0]
+        yield pair[1]
+  docs = nlp.pipe(texts(), batch_size=batch_size * 2, n_process=n_process)
+  while True:
+    while pending and pending[0] is not None:
+      yield pending.popleft()
+    pair = list(islice(docs, 2))
+    if not pair:
+      yield from pending
+      return
+    while pending[0] is not None:
+      yield pending.popleft()
+    pending.popleft()
+    yield markup_within(pair[0], pair[1], budget, max_cells) if budgeted else markup(pair[0], pair[1])
+
+def iter_docs(pairs, batch_size=64, n_process=1, nlp=None):
+  nlp = nlp or load()
+  texts = (text for pair in pairs for text in pair[:2])
+  docs = nlp.pipe(texts, batch_size=batch_size * 2, n_process=n_process)
+  while True:
+    pair = list(islice(docs, 2))
+    if not pair:
+      return
+    yield pair[0], pair[1]
+
+def handle_candidates(orig_text, cor_texts, batch_size=64, nlp=None):
+  nlp = nlp or load()
+  orig = nlp(orig_text)
+  orig_feats = TokenFeatures(orig)
+  return [annotate(orig, cor, orig_feats) for cor in nlp.pipe(cor_texts, batch_size=batch_size)]
+
+def edit_batch(pairs, batch_size=64, n_process=1, nlp=None):
+  batch = EditBatch()
+  for orig, cor in iter_docs(pairs, batch_size=batch_size, n_process=n_process, nlp=nlp):
+    batch.add(orig, get_edits(orig, cor))
+  return batch
+
+def annotate(orig, cor, orig_feats=None):
+  return annotations(get_edits(orig, cor, orig_feats))
+
+def annotations(edits):
+  return [(edit.type[2:], edit.o_str, edit.o_start, edit.o_end, edit.c_str, edit.c_start, edit.c_end) for edit in edits]
+
+def get_edits(orig, cor, orig_feats=None):
+  with metrics.timer("align"):
+    alignment = Alignment(orig, cor, orig_feats)
+  with metrics.timer("rule_edits"):
+    edits = alignment.get_rule_edits()
+  with metrics.timer("classify"):
+    return [classify(edit) for edit in edits]
+
+def markup(orig, cor):
+  edits = get_edits(orig, cor)
+  with metrics.timer("render"):
+    return render(orig, edits)
+
+def document_markup(orig, cor, workers=1, pool=None):
+  edits = sentences.document_edits(orig, cor, workers, pool=pool)
+  with metrics.timer("render"):
+    return render(orig, edits)
+
+def markup_within(orig, cor, budget=None, max_cells=None):
+  edits, mode = fallback.get_edits(orig, cor, budget, max_cells)
+  if metrics.enabled:
+    metrics.incr("mode." + mode)
+  with metrics.timer("render"):
+    return render(orig, edits), mode
+
+def warm(nlp=None):
+  # Runs one small pair through every stage so that the pipeline and all
+  # lazily built tables exist before the caller forks workers.
+  nlp = nlp or load()
+  orig, cor = nlp.pipe(["This are a examples , of teh tests .", "These are examples of the tests ."])
+  markup(orig, cor)
+  return nlp
 
 if __name__ == "__main__":
-  handler()
\ No newline at end of file
+  print(handler('what', '?what'))
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 class LancasterStemmer:
     default_rule_tuple = (
@@ -119,25 +120,38 @@ class LancasterStemmer:
         "zy1s.",  # -yz > -ys
     )
 
-    def __init__(self, rule_tuple=None, strip_prefix_flag=False):
+    rule_pattern = re.compile(r"^([a-z]+)(\*?)(\d)([a-z]*)([>\.]?)$")
+
+    def __init__(self, rule_tuple=None, strip_prefix_flag=False, cache_size=65536):
         self.rule_dictionary = {}
         self._strip_prefix = strip_prefix_flag
         self._rule_tuple = rule_tuple if rule_tuple else self.default_rule_tuple
+        self._cached_stem = lru_cache(maxsize=cache_size)(self.__stem)
 
     def parseRules(self, rule_tuple=None):
+        # Each rule is parsed once into (suffix, intact_only, remove_total,
+        # append_string, stop) and filed under the last letter it matches.
         rule_tuple = rule_tuple if rule_tuple else self._rule_tuple
-        valid_rule = re.compile("^[a-z]+\*?\d[a-z]*[>\.]?$")
         self.rule_dictionary = {}
         for rule in rule_tuple:
-            if not valid_rule.match(rule):
+            rule_match = self.rule_pattern.match(rule)
+            if not rule_match:
                 raise ValueError("The rule {0} is invalid".format(rule))
-            first_letter = rule[0:1]
-            if first_letter in self.rule_dictionary:
-                self.rule_dictionary[first_letter].append(rule)
-            else:
-                self.rule_dictionary[first_letter] = [rule]
+            ending_string, intact_flag, remove_total, append_string, cont_flag = rule_match.groups()
+            parsed = (ending_string[::-1], bool(intact_flag), int(remove_total), append_string, cont_flag == ".")
+            self.rule_dictionary.setdefault(rule[0], []).append(parsed)
+        self._cached_stem.cache_clear()
 
     def stem(self, word):
+        return self._cached_stem(word)
+
+    def stem_many(self, words):
+        return [self._cached_stem(word) for word in words]
+
+    def cache_info(self):
+        return self._cached_stem.cache_info()
+
+    def __stem(self, word):
         word = word.lower()
         word = self.__stripPrefix(word) if self._strip_prefix else word
         intact_word = word
@@ -146,7 +160,6 @@ class LancasterStemmer:
         return self.__doStemming(word, intact_word)
 
     def __doStemming(self, word, intact_word):
-        valid_rule = re.compile("^([a-z]+)(\*?)(\d)([a-z]*)([>\.]?)$")
         proceed = True
         while proceed:
             last_letter_position = self.__getLastLetter(word)
@@ -154,31 +167,16 @@ class LancasterStemmer:
                 proceed = False
             else:
                 rule_was_applied = False
-                for rule in self.rule_dictionary[word[last_letter_position]]:
-                    rule_match = valid_rule.match(rule)
-                    if rule_match:
-                        (
-                            ending_string,
-                            intact_flag,
-                            remove_total,
-                            append_string,
-                            cont_flag,
-                        ) = rule_match.groups()
-                        remove_total = int(remove_total)
-                        if word.endswith(ending_string[::-1]):
-                            if intact_flag:
-                                if word == intact_word and self.__isAcceptable(word, remove_total):
-                                    word = self.__applyRule(word, remove_total, append_string)
-                                    rule_was_applied = True
-                                    if cont_flag == ".":
-                                        proceed = False
-                                    break
-                            elif self.__isAcceptable(word, remove_total):
-                                word = self.__applyRule(word, remove_total, append_string)
-                                rule_was_applied = True
-                                if cont_flag == ".":
-                                    proceed = False
-                                break
+                for ending_string, intact_only, remove_total, append_string, stop in self.rule_dictionary[word[last_letter_position]]:
+                    if word.endswith(ending_string):
+                        if intact_only and word != intact_word:
+                            continue
+                        if self.__isAcceptable(word, remove_total):
+                            word = self.__applyRule(word, remove_total, append_string)
+                            rule_was_applied = True
+                            if stop:
+                                proceed = False
+                            break
                 if rule_was_applied == False:
                     proceed = False
         return word
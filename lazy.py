@@ -0,0 +1,62 @@
+from bisect import bisect_left, bisect_right
+from spacy.pipeline import Sentencizer
+from spacy.tokens import Doc
+import fastpath
+from alignment import Alignment, lcs_blocks
+from features import TokenFeatures
+from utils import classify
+
+_sentencizer = Sentencizer()
+
+def get_edits(orig_text, cor_text, nlp):
+    # Tokenizes both texts, finds the differing token blocks with an LCS
+    # and runs the rest of the pipeline (tagger, lemmatizer, parser) only on
+    # the rule-based sentences holding a block that is more than a case,
+    # spacing or punctuation change. The annotated sentences are stitched
+    # back into full Docs, aligned with anchored windows, and each edit is
+    # classified from surface features when its sentences were not parsed.
+    # Returns (orig, edits).
+    orig = nlp.make_doc(orig_text)
+    cor = nlp.make_doc(cor_text)
+    o = TokenFeatures(orig)
+    c = TokenFeatures(cor)
+    blocks = lcs_blocks(o, c)
+    if not blocks:
+        return orig, []
+    content = [(o0, o1, c0, c1) for o0, o1, c0, c1 in blocks if fastpath.get_type(o, o0, o1, c, c0, c1) == "NA"]
+    if content:
+        orig, o_parsed = parse_sentences(orig, [(o0, o1) for o0, o1, c0, c1 in content], nlp)
+        cor, c_parsed = parse_sentences(cor, [(c0, c1) for o0, o1, c0, c1 in content], nlp)
+        o = TokenFeatures(orig)
+        c = TokenFeatures(cor)
+    else:
+        o_parsed = c_parsed = set()
+    edits = Alignment(orig, cor, o, c, anchored=True).get_rule_edits()
+    for edit in edits:
+        surface = fastpath.get_type(o, edit.o_start, edit.o_end, c, edit.c_start, edit.c_end)
+        parsed = all(i in o_parsed for i in range(edit.o_start, edit.o_end)) and all(i in c_parsed for i in range(edit.c_start, edit.c_end))
+        if surface == "NA" or parsed:
+            classify(edit)
+        else:
+            edit.type = surface
+    return orig, edits
+
+def parse_sentences(doc, ranges, nlp):
+    # Runs the pipeline on the sentences of tokenizer-only `doc` that touch
+    # any of the token ranges (an empty range touches the sentence it sits
+    # in) and returns the stitched Doc along with the parsed token indices.
+    _sentencizer(doc)
+    sents = list(doc.sents)
+    if not sents:
+        return doc, set()
+    starts = [sent.start for sent in sents]
+    wanted = set()
+    for start, end in ranges:
+        first = max(bisect_right(starts, start) - 1, 0)
+        last = bisect_left(starts, end) - 1 if end > start else first
+        wanted.update(range(first, last+1))
+    wanted = sorted(wanted)
+    parsed = dict(zip(wanted, nlp.pipe(sents[i].as_doc() for i in wanted)))
+    pieces = [parsed[i] if i in parsed else sent.as_doc() for i, sent in enumerate(sents)]
+    tokens = {t for i in wanted for t in range(sents[i].start, sents[i].end)}
+    return Doc.from_docs(pieces, ensure_whitespace=False), tokens
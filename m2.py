@@ -0,0 +1,98 @@
+import argparse
+import sys
+from itertools import zip_longest
+import index
+from edit import EditBatch
+from model import load
+from pool import chunked, imap_ordered, prefork_imap
+
+_worker = {}
+
+def init_worker(model_name, batch_size, annotator):
+    _worker["nlp"] = index.warm(load(model_name))
+    _worker["batch_size"] = batch_size
+    _worker["annotator"] = annotator
+
+def annotate_chunk(pairs):
+    batch = EditBatch()
+    for orig, cor in index.iter_docs(pairs, batch_size=_worker["batch_size"], nlp=_worker["nlp"]):
+        batch.add(orig, index.get_edits(orig, cor))
+    return "\n".join(batch.to_m2(_worker["annotator"])) + "\n"
+
+def read_parallel(orig_path, cor_path):
+    # Runs of whitespace are collapsed to single spaces, as in ERRANT's
+    # parallel_to_m2: spaCy would otherwise make whitespace tokens that
+    # cannot be written to an M2 sentence line.
+    with open(orig_path, encoding="utf8") as orig_file, open(cor_path, encoding="utf8") as cor_file:
+        for line, (orig, cor) in enumerate(zip_longest(orig_file, cor_file), 1):
+            if orig is None or cor is None:
+                raise ValueError("{0} and {1} differ in length at line {2}".format(orig_path, cor_path, line))
+            yield " ".join(orig.split()), " ".join(cor.split())
+
+def write_m2(orig_path, cor_path, out=None, model_name=None, workers=1, chunk_size=256, max_in_flight=None, batch_size=64, annotator=0,
+             prefork=False, max_tasks_per_child=None):
+    # Sentences are read lazily, annotated chunk by chunk and written back in
+    # input order as soon as each chunk is done.
+    out = out or sys.stdout
+    chunks = chunked(read_parallel(orig_path, cor_path), chunk_size)
+    initargs = (model_name, batch_size, annotator)
+    if workers <= 1:
+        init_worker(*initargs)
+        results = map(annotate_chunk, chunks)
+    elif prefork:
+        results = prefork_imap(annotate_chunk, chunks, workers, max_in_flight, init_worker, initargs, max_tasks_per_child)
+    else:
+        results = imap_ordered(annotate_chunk, chunks, workers, max_in_flight, init_worker, initargs, maxtasksperchild=max_tasks_per_child)
+    for block in results:
+        out.write(block)
+
+def read_m2(path):
+    # Yields (tokens, edits) per sentence block without loading the file;
+    # an edit is (o_start, o_end, type, correction, annotator) and noop
+    # lines are dropped.
+    with open(path, encoding="utf8") as m2_file:
+        tokens = None
+        edits = []
+        for line in m2_file:
+            line = line.rstrip("\n")
+            if line.startswith("S "):
+                if tokens is not None:
+                    yield tokens, edits
+                tokens = line[2:].split(" ") if len(line) > 2 else []
+                edits = []
+            elif line.startswith("A "):
+                span, type, correction, _, _, annotator = line[2:].split("|||")
+                if type == "noop":
+                    continue
+                o_start, o_end = span.split()
+                edits.append((int(o_start), int(o_end), type, correction, int(annotator)))
+            elif not line and tokens is not None:
+                yield tokens, edits
+                tokens = None
+                edits = []
+        if tokens is not None:
+            yield tokens, edits
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Annotate parallel original/corrected files as M2.")
+    parser.add_argument("orig_path", metavar="orig", help="original sentences, one per line")
+    parser.add_argument("cor_path", metavar="cor", help="corrected sentences, aligned line by line with orig")
+    parser.add_argument("-o", "--out", default=None, help="M2 output file (default: stdout)")
+    parser.add_argument("--model", dest="model_name", default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--max-in-flight", type=int, default=None, help="chunks queued ahead of the writer (default: 2 per worker)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--annotator", type=int, default=0)
+    parser.add_argument("--prefork", action="store_true", help="load the model once and fork workers that share it copy-on-write")
+    parser.add_argument("--max-tasks-per-child", type=int, default=None, help="chunks a worker handles before it is replaced")
+    args = vars(parser.parse_args(argv))
+    path = args.pop("out")
+    if path is None:
+        write_m2(**args)
+    else:
+        with open(path, "w", encoding="utf8") as out:
+            write_m2(out=out, **args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import heapq
+import json
+import os
+import threading
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+# Off by default. Hot paths test `metrics.enabled` (or use timer(), which
+# hands back a shared no-op context manager) before recording anything, so
+# a disabled build pays one attribute lookup per stage.
+enabled = False
+slowest_size = 10
+
+counters = {}
+peaks = {}
+timings = {}
+collectors = {}
+sinks = []
+slowest = []
+_null = nullcontext()
+_lock = threading.Lock()
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    with _lock:
+        counters.clear()
+        peaks.clear()
+        timings.clear()
+        slowest.clear()
+
+def incr(name, value=1):
+    with _lock:
+        counters[name] = counters.get(name, 0) + value
+
+def peak(name, value):
+    with _lock:
+        if value > peaks.get(name, value - 1):
+            peaks[name] = value
+
+def observe(name, seconds):
+    with _lock:
+        timing = timings.get(name)
+        if timing is None:
+            timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+def timer(name):
+    return _Timer(name) if enabled else _null
+
+def record_pair(seconds, orig_text, cor_text):
+    # Keeps the slowest pairs seen so far, to find the inputs behind the
+    # latency tail.
+    observe("pair", seconds)
+    item = (seconds, orig_text, cor_text)
+    with _lock:
+        if len(slowest) < slowest_size:
+            heapq.heappush(slowest, item)
+        elif seconds > slowest[0][0]:
+            heapq.heapreplace(slowest, item)
+
+def collect(name, func):
+    # func() returns a dict of numbers read at snapshot time, e.g. a cache's
+    # stats(); nothing is recorded on the hot path.
+    collectors[name] = func
+
+def add_sink(sink):
+    sinks.append(sink)
+
+def snapshot():
+    with _lock:
+        result = {
+            "counters": dict(counters),
+            "peaks": dict(peaks),
+            "timings": {name: {"count": count, "sum": total, "max": top} for name, (count, total, top) in timings.items()},
+            "slowest": [{"seconds": s, "original": o, "corrected": c} for s, o, c in sorted(slowest, reverse=True)],
+        }
+    result["gauges"] = {name: func() for name, func in collectors.items()}
+    return result
+
+def flush():
+    data = snapshot()
+    for sink in sinks:
+        sink(data)
+    return data
+
+def flush_every(interval):
+    # Calls flush() from a daemon thread every `interval` seconds until the
+    # returned event is set.
+    stop = threading.Event()
+    def loop():
+        while not stop.wait(interval):
+            flush()
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
+
+def json_sink(path):
+    def write(data):
+        tmp = path + ".%d.tmp" % os.getpid()
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    return write
+
+def to_prometheus(data=None, prefix="highlighter"):
+    data = data or snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        metric = _metric_name(prefix, name) + "_total"
+        lines += ["# TYPE %s counter" % metric, "%s %s" % (metric, value)]
+    for name, value in sorted(data["peaks"].items()):
+        metric = _metric_name(prefix, name) + "_max"
+        lines += ["# TYPE %s gauge" % metric, "%s %s" % (metric, value)]
+    for name, timing in sorted(data["timings"].items()):
+        metric = _metric_name(prefix, name) + "_seconds"
+        lines += ["# TYPE %s summary" % metric,
+                  "%s_count %s" % (metric, timing["count"]),
+                  "%s_sum %s" % (metric, timing["sum"]),
+                  "# TYPE %s_max gauge" % metric,
+                  "%s_max %s" % (metric, timing["max"])]
+    for name, values in sorted(data["gauges"].items()):
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)):
+                metric = _metric_name(prefix, name, key)
+                lines += ["# TYPE %s gauge" % metric, "%s %s" % (metric, value)]
+    return "\n".join(lines) + "\n"
+
+def serve(port=9100, addr=""):
+    # Serves to_prometheus() on every GET from a daemon thread; returns the
+    # server so the caller can shut it down.
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = to_prometheus().encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _metric_name(*parts):
+    return "_".join(part.replace(".", "_").replace("-", "_") for part in parts)
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, perf_counter() - self.start)
@@ -0,0 +1,16 @@
+import os
+import spacy
+from functools import lru_cache
+
+DEFAULT_MODEL = os.environ.get("HIGHLIGHTER_MODEL", "en_core_web_sm")
+# Alignment and classification only read tag_, pos, lemma, dep_, head and
+# children, so the entity recognizer and the standalone sentencizer are never
+# loaded.
+UNUSED_COMPONENTS = ("ner", "senter")
+
+@lru_cache(maxsize=None)
+def _load(name, exclude):
+    return spacy.load(name, exclude=list(exclude))
+
+def load(name=None, exclude=UNUSED_COMPONENTS):
+    return _load(name or DEFAULT_MODEL, tuple(exclude))
@@ -0,0 +1,73 @@
+import atexit
+import gc
+import multiprocessing as mp
+import os
+from collections import deque
+
+def imap_ordered(func, items, workers=None, max_in_flight=None, initializer=None, initargs=(), context=None, maxtasksperchild=None, pool=None):
+    # Like Pool.imap, but never pulls more than max_in_flight items ahead of
+    # the consumer, so a slow writer throttles the reader instead of the
+    # whole input being queued in memory. A caller-owned `pool` is used as
+    # it is and left open; otherwise one is started and torn down here.
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * 2
+    if pool is not None:
+        yield from _imap_pool(pool, func, items, max_in_flight)
+        return
+    with mp.get_context(context).Pool(workers, initializer, initargs, maxtasksperchild) as pool:
+        yield from _imap_pool(pool, func, items, max_in_flight)
+
+def _imap_pool(pool, func, items, max_in_flight):
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+_shared = {}
+
+def shared_pool(workers=None):
+    # A process-wide pool per worker count, started on first use and kept
+    # for later calls, for callers that fan out many small jobs (e.g. one
+    # document at a time) and would otherwise pay worker start-up each time.
+    workers = workers or os.cpu_count()
+    pool = _shared.get(workers)
+    if pool is None:
+        pool = _shared[workers] = mp.Pool(workers)
+    return pool
+
+@atexit.register
+def close_shared():
+    while _shared:
+        pool = _shared.popitem()[1]
+        pool.terminate()
+        pool.join()
+
+def prefork_imap(func, items, workers=None, max_in_flight=None, initializer=None, initargs=(), maxtasksperchild=None):
+    # imap_ordered over forked workers that share the parent's state: the
+    # initializer runs once here, before the fork, so the model, vocab and
+    # lookup tables it builds are inherited copy-on-write instead of being
+    # loaded by every worker. gc.freeze() keeps the collector from touching
+    # (and so copying) those objects in the children. Workers recycled after
+    # maxtasksperchild tasks are forked again from the same clean parent,
+    # which caps per-worker StringStore growth.
+    if initializer:
+        initializer(*initargs)
+    gc.collect()
+    gc.freeze()
+    try:
+        yield from imap_ordered(func, items, workers, max_in_flight, context="fork", maxtasksperchild=maxtasksperchild)
+    finally:
+        gc.unfreeze()
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,110 @@
+import argparse
+import os
+import sys
+import tempfile
+import spacy
+import srsly
+from spacy.tokens import Doc
+import m2
+from alignment import Alignment
+from model import load
+from utils import classify
+
+CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regress_cases.jsonl")
+# Token columns stored for each side of a case, enough to rebuild the
+# annotated Doc without loading a model.
+COLUMNS = ("text", "ws", "tag", "pos", "lemma", "dep", "head")
+
+def to_rows(doc):
+    return [[tok.text, tok.whitespace_, tok.tag_, tok.pos_, tok.lemma_, tok.dep_, tok.head.i] for tok in doc]
+
+def to_doc(vocab, rows):
+    text, ws, tag, pos, lemma, dep, head = zip(*rows) if rows else ([],) * len(COLUMNS)
+    return Doc(vocab, words=list(text), spaces=[bool(s) for s in ws], tags=list(tag), pos=list(pos),
+               lemmas=list(lemma), deps=list(dep), heads=list(head))
+
+def outputs(orig, cor):
+    alignment = Alignment(orig, cor)
+    edits = [classify(edit) for edit in alignment.get_rule_edits()]
+    return {"align_seq": [list(op) for op in alignment.align_seq],
+            "edits": [[e.o_start, e.o_end, e.c_start, e.c_end, e.type, e.o_str, e.c_str] for e in edits]}
+
+def record(nlp, pairs):
+    # Cases for (original, corrected) text pairs with the outputs of the
+    # current code as the expected values.
+    cases = []
+    for i, (orig, cor) in enumerate(zip(*[iter(nlp.pipe(text for pair in pairs for text in pair))]*2)):
+        case = {"id": i, "orig": to_rows(orig), "cor": to_rows(cor)}
+        case.update(outputs(orig, cor))
+        cases.append(case)
+    return cases
+
+def check(path=CASES):
+    # Returns (id, field, expected, found) for every case whose alignment or
+    # classified edits differ from the recorded ones.
+    vocab = spacy.blank("en").vocab
+    failures = []
+    for case in srsly.read_jsonl(path):
+        found = outputs(to_doc(vocab, case["orig"]), to_doc(vocab, case["cor"]))
+        for field in ("align_seq", "edits"):
+            if found[field] != case[field]:
+                failures.append((case["id"], field, case[field], found[field]))
+    return failures
+
+# Parallel lines written as M2 and read back by check_m2; runs of spaces and
+# tabs must not leave whitespace tokens in the S lines.
+M2_CASES = [
+    ("I has  a apple .", "I have an apple ."),
+    ("She go\tto school  every days .", "She goes to  school every day ."),
+    ("  We was very exciting about the trip .  ", "We were very excited about the trip ."),
+]
+
+def check_m2(nlp=None, pairs=M2_CASES):
+    # Returns (orig, cor, found) for every pair whose M2 block does not
+    # read back as the original tokens with edits that rebuild the
+    # corrected tokens. Only the tokenizer matters here, so a blank
+    # pipeline will do.
+    nlp = nlp or spacy.blank("en")
+    with tempfile.TemporaryDirectory() as path:
+        orig_path = os.path.join(path, "orig.txt")
+        cor_path = os.path.join(path, "cor.txt")
+        m2_path = os.path.join(path, "out.m2")
+        for name, side in ((orig_path, 0), (cor_path, 1)):
+            with open(name, "w", encoding="utf8") as f:
+                f.writelines(pair[side] + "\n" for pair in pairs)
+        m2._worker.update(nlp=nlp, batch_size=64, annotator=0)
+        with open(m2_path, "w", encoding="utf8") as out:
+            out.write(m2.annotate_chunk(list(m2.read_parallel(orig_path, cor_path))))
+        blocks = list(m2.read_m2(m2_path))
+    failures = []
+    for (orig, cor), (tokens, edits) in zip(pairs, blocks):
+        found = list(tokens)
+        for o_start, o_end, type, correction, annotator in sorted(edits, reverse=True):
+            found[o_start:o_end] = correction.split(" ") if correction else []
+        if tokens != orig.split() or found != cor.split():
+            failures.append((orig, cor, found))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check alignment and classification against recorded cases.")
+    parser.add_argument("--cases", default=CASES)
+    parser.add_argument("--record", default=None, help="JSONL file of original/corrected pairs to parse and record as the new cases")
+    parser.add_argument("--model", dest="model_name", default=None)
+    args = parser.parse_args(argv)
+    if args.record:
+        pairs = [(r["original"], r["corrected"]) for r in srsly.read_jsonl(args.record)]
+        srsly.write_jsonl(args.cases, record(load(args.model_name), pairs))
+        return
+    failures = check(args.cases)
+    for id, field, expected, found in failures:
+        print("MISMATCH case %s %s:\n  expected %s\n  found    %s" % (id, field, expected, found), file=sys.stderr)
+    print("%d mismatched cases" % len({failure[0] for failure in failures}) if failures else "all cases match")
+    m2_failures = check_m2()
+    for orig, cor, found in m2_failures:
+        print("M2 ROUND TRIP %r -> %r:\n  read back %s" % (orig, cor, found), file=sys.stderr)
+    print("%d M2 round trips failed" % len(m2_failures) if m2_failures else "M2 round trips match")
+    if failures or m2_failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
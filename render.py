@@ -0,0 +1,45 @@
+def render(orig, edits):
+    # Walks the original text once, copying the untouched stretches between
+    # edits by character offset and wrapping each edited token span in its
+    # tag. `edits` must be sorted by o_start, as Alignment.get_rule_edits
+    # returns them.
+    text = orig.text
+    parts = []
+    pos = 0
+    free = 0
+    for k, edit in enumerate(edits):
+        edit_type = edit.type[2:]
+        if edit.o_start == edit.o_end:
+            next_start = edits[k+1].o_start if k+1 < len(edits) else len(orig)
+            if free <= edit.o_start - 1:
+                anchor = orig[edit.o_start-1]
+                replacement = edit.c_str if edit_type == "PUNCT" else anchor.text + " " + edit.c_str
+            elif edit.o_start < next_start:
+                anchor = orig[edit.o_start]
+                replacement = edit.c_str if edit_type == "PUNCT" else edit.c_str + " " + anchor.text
+            else:
+                start = orig[edit.o_start].idx if edit.o_start < len(orig) else len(text)
+                parts.append(text[pos:start])
+                parts.append(tag("a", edit_type, edit.c_str, ""))
+                pos = start
+                continue
+            start = anchor.idx
+            end = start + len(anchor.text)
+            parts.append(text[pos:start])
+            parts.append(tag("a", edit_type, replacement, anchor.text))
+            free = anchor.i + 1
+        else:
+            start = orig[edit.o_start].idx
+            end = orig[edit.o_end-1].idx + len(orig[edit.o_end-1].text)
+            parts.append(text[pos:start])
+            if edit.c_start == edit.c_end:
+                parts.append(tag("d", edit_type, "", text[start:end]))
+            else:
+                parts.append(tag("c", edit_type, edit.c_str, text[start:end]))
+            free = edit.o_end
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def tag(name, edit_type, replacement, content):
+    return "<" + name + " type='" + edit_type + "' edit='" + replacement + "'>" + content + "</" + name + ">"
@@ -0,0 +1,110 @@
+import spacy
+from functools import lru_cache
+from rapidfuzz.distance import Indel
+from spacy.tokens import Doc
+from alignment import Alignment
+from edit import Edit, span_text
+from features import TokenFeatures
+from pool import imap_ordered, shared_pool
+from utils import classify
+
+# Sentence beads tried by pair_sentences, as (orig sentences, cor sentences):
+# one to one, deletions and insertions of whole sentences, splits and merges.
+BEADS = ((1, 1), (1, 0), (0, 1), (1, 2), (2, 1))
+
+def sentence_bounds(doc):
+    if len(doc) and doc.has_annotation("SENT_START"):
+        return [(sent.start, sent.end) for sent in doc.sents]
+    return [(0, len(doc))]
+
+def pair_sentences(o_texts, c_texts, band=8):
+    # Gale-Church style DP over sentences: a bead costs the character-level
+    # Indel distance between its joined sides, so a sentence split in two
+    # is cheapest as one 1-2 bead. Only cells within `band` of the diagonal
+    # (widened by the difference in sentence counts) are filled. Returns
+    # [(o_lo, o_hi, c_lo, c_hi)] sentence index ranges covering both lists.
+    n = len(o_texts)
+    m = len(c_texts)
+    width = band + abs(n - m)
+    inf = float("inf")
+    cost = [[inf]*(m+1) for i in range(n+1)]
+    back = [[None]*(m+1) for i in range(n+1)]
+    cost[0][0] = 0
+    for i in range(n+1):
+        center = i * m // n if n else 0
+        for j in range(max(0, center - width), min(m, center + width) + 1):
+            for di, dj in BEADS:
+                if i < di or j < dj or cost[i-di][j-dj] == inf:
+                    continue
+                a = " ".join(o_texts[i-di:i])
+                b = " ".join(c_texts[j-dj:j])
+                total = cost[i-di][j-dj] + Indel.distance(a, b)
+                if total < cost[i][j]:
+                    cost[i][j] = total
+                    back[i][j] = (di, dj)
+    if back[n][m] is None and (n or m):
+        return [(0, n, 0, m)]
+    beads = []
+    i, j = n, m
+    while i or j:
+        di, dj = back[i][j]
+        beads.append((i-di, i, j-dj, j))
+        i -= di
+        j -= dj
+    beads.reverse()
+    return beads
+
+def sentence_windows(orig, cor, orig_feats=None, cor_feats=None):
+    # Alignment windows, in document token offsets, for each pair of
+    # sentence groups matched by pair_sentences.
+    orig_feats = TokenFeatures(orig) if orig_feats is None else orig_feats
+    cor_feats = TokenFeatures(cor) if cor_feats is None else cor_feats
+    o_bounds = sentence_bounds(orig)
+    c_bounds = sentence_bounds(cor)
+    o_texts = [span_text(orig_feats, start, end) for start, end in o_bounds]
+    c_texts = [span_text(cor_feats, start, end) for start, end in c_bounds]
+    windows = []
+    for o_lo, o_hi, c_lo, c_hi in pair_sentences(o_texts, c_texts):
+        o_start = o_bounds[o_lo][0] if o_lo < len(o_bounds) else len(orig)
+        o_end = o_bounds[o_hi-1][1] if o_lo < o_hi else o_start
+        c_start = c_bounds[c_lo][0] if c_lo < len(c_bounds) else len(cor)
+        c_end = c_bounds[c_hi-1][1] if c_lo < c_hi else c_start
+        equal = orig_feats.orth[o_start:o_end] == cor_feats.orth[c_start:c_end]
+        windows.append((o_start, o_end, c_start, c_end, equal))
+    return windows
+
+def document_edits(orig, cor, workers=1, orig_feats=None, cor_feats=None, pool=None):
+    # Aligns each pair of matched sentences on its own, so the DP cost grows
+    # with the sentence lengths rather than the document length. With
+    # workers > 1 or a caller-owned `pool` the differing pairs are shipped
+    # as serialised sentence Docs to worker processes and their edits
+    # shifted back to document offsets here. Without a pool, a shared one
+    # of `workers` processes is reused across calls.
+    orig_feats = TokenFeatures(orig) if orig_feats is None else orig_feats
+    cor_feats = TokenFeatures(cor) if cor_feats is None else cor_feats
+    windows = [window for window in sentence_windows(orig, cor, orig_feats, cor_feats) if not window[4]]
+    if pool is None and workers <= 1:
+        edits = []
+        for window in windows:
+            edits.extend(Alignment(orig, cor, orig_feats, cor_feats, windows=[window]).get_rule_edits())
+        return [classify(edit) for edit in edits]
+    jobs = ((orig.lang_, orig[o0:o1].as_doc().to_bytes(), cor[c0:c1].as_doc().to_bytes()) for o0, o1, c0, c1, equal in windows)
+    edits = []
+    for (o0, o1, c0, c1, equal), found in zip(windows, imap_ordered(align_pair, jobs, workers, len(windows) or 1, pool=pool or shared_pool(workers))):
+        for o_start, o_end, c_start, c_end, type in found:
+            edits.append(Edit(orig, cor, (o0+o_start, o0+o_end, c0+c_start, c0+c_end), type, orig_feats, cor_feats))
+    return edits
+
+def align_pair(job):
+    lang, orig_bytes, cor_bytes = job
+    vocab = blank_vocab(lang)
+    orig = Doc(vocab).from_bytes(orig_bytes)
+    cor = Doc(vocab).from_bytes(cor_bytes)
+    edits = Alignment(orig, cor).get_rule_edits()
+    return [(edit.o_start, edit.o_end, edit.c_start, edit.c_end, classify(edit).type) for edit in edits]
+
+@lru_cache
+def blank_vocab(lang):
+    # The language's lexical attribute getters (LOWER, IS_PUNCT, ...) are
+    # all a worker needs to rebuild the serialised Docs.
+    return spacy.blank(lang).vocab
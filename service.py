@@ -0,0 +1,128 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import index
+from model import load
+
+_worker = {}
+
+def init_worker(model_name):
+    _worker["nlp"] = load(model_name)
+
+def run_batch(pairs, nlp=None, budget=None, max_cells=None, model_name=None):
+    # Without a shared nlp the model is loaded (once, see model.load) here on
+    # the executor rather than on the event loop.
+    nlp = nlp or _worker.get("nlp") or load(model_name)
+    return list(index.iter_batch(pairs, batch_size=len(pairs), nlp=nlp, budget=budget, max_cells=max_cells))
+
+class BatchScheduler:
+    # Collects concurrent requests for up to max_wait seconds or max_batch
+    # pairs, runs each batch through nlp.pipe and the alignment pipeline on
+    # an executor and resolves every caller's future. At most max_queue
+    # requests wait to be batched; submit() then waits for room (or raises
+    # asyncio.QueueFull with block=False), and at most max_concurrency
+    # batches run at once. With processes=True the batches run in worker
+    # processes that each load `model_name`; otherwise they run on threads
+    # sharing `nlp`, or `model_name` loaded by the first batch, so building a
+    # scheduler never blocks the event loop on spacy.load.
+    def __init__(self, nlp=None, model_name=None, max_batch=32, max_wait=0.005, max_queue=1024, max_concurrency=1,
+                 processes=False, executor=None, budget=None, max_cells=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self.queue = None
+        self.max_queue = max_queue
+        self.slots = None
+        self.runner = None
+        self.in_flight = set()
+        self.own_executor = executor is None
+        if processes:
+            self.executor = executor or ProcessPoolExecutor(max_concurrency, initializer=init_worker, initargs=(model_name,))
+            self.work = partial(run_batch, budget=budget, max_cells=max_cells)
+        else:
+            self.executor = executor or ThreadPoolExecutor(max_concurrency)
+            self.work = partial(run_batch, nlp=nlp, budget=budget, max_cells=max_cells, model_name=model_name)
+
+    async def submit(self, orig_text, cor_text, block=True):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        item = (orig_text, cor_text, future)
+        if block:
+            await self.queue.put(item)
+        else:
+            self.queue.put_nowait(item)
+        return await future
+
+    def start(self):
+        # The queue and batching loop belong to the running event loop; a
+        # scheduler reused under a new loop starts them afresh.
+        if self.runner is None or self.runner.get_loop() is not asyncio.get_running_loop():
+            self.queue = asyncio.Queue(self.max_queue)
+            self.slots = asyncio.Semaphore(self.max_concurrency)
+            self.runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        # Finishes everything already queued, then stops the batching loop
+        # and releases the executor.
+        if self.runner is not None:
+            await self.queue.join()
+            self.runner.cancel()
+            if self.in_flight:
+                await asyncio.gather(*self.in_flight, return_exceptions=True)
+            self.runner = None
+        if self.own_executor:
+            self.executor.shutdown()
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            task = loop.create_task(self._dispatch(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        live = [item for item in batch if not item[2].done()]
+        try:
+            if live:
+                results = await loop.run_in_executor(self.executor, self.work, [item[:2] for item in live])
+                for (_, _, future), result in zip(live, results):
+                    if not future.done():
+                        future.set_result(result)
+        except Exception as error:
+            for _, _, future in live:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self.slots.release()
+            for _ in batch:
+                self.queue.task_done()
+
+_scheduler = None
+
+async def ahandle(orig_text, cor_text, scheduler=None):
+    # Async counterpart of index.handler. Without a scheduler, calls share a
+    # default BatchScheduler on the default model.
+    global _scheduler
+    if scheduler is None:
+        if _scheduler is None:
+            _scheduler = BatchScheduler()
+        scheduler = _scheduler
+    return await scheduler.submit(orig_text, cor_text)
@@ -1,5 +1,8 @@
 import spacy.symbols as POS
+from spacy.strings import hash_string
+from cache import LRUCache
 from lancaster import LancasterStemmer
+import metrics
 from rapidfuzz.distance import Levenshtein
 
 rare_pos = {"INTJ", "NUM", "SYM", "X"}
@@ -87,45 +90,71 @@ pos_map = {
   "``":"PUNCT"
 }
 
+verb_tags = {hash_string(tag) for tag, pos in pos_map.items() if pos == "VERB"}
+
 stemmer = LancasterStemmer()
 
+# Edit types keyed by the token signatures of both sides; set to None to
+# classify every edit from scratch.
+classify_cache = LRUCache(maxsize=65536)
+metrics.collect("classify_cache", lambda: classify_cache.stats() if classify_cache is not None else {})
+metrics.collect("stemmer", lambda: stemmer_stats(stemmer))
+
+def stemmer_stats(stemmer):
+    info = stemmer.cache_info()
+    return {"calls": info.hits + info.misses, "hits": info.hits, "misses": info.misses, "size": info.currsize}
+
 def classify(edit):
-    if not edit.o_toks and not edit.c_toks:
-        edit.type = "UNK"
-    elif not edit.o_toks and edit.c_toks:
-        op = "M:"
-        cat = get_one_sided_type(edit.c_toks)
-        edit.type = op+cat
-    elif edit.o_toks and not edit.c_toks:
-        op = "U:"
-        cat = get_one_sided_type(edit.o_toks)
-        edit.type = op+cat
+    o = edit.o_feats
+    c = edit.c_feats
+    o0, o1, c0, c1 = edit.o_start, edit.o_end, edit.c_start, edit.c_end
+    same_str = edit.o_str == edit.c_str
+    if classify_cache is None:
+        edit.type = get_type(o, o0, o1, c, c0, c1, same_str)
+        return edit
+    # preceded_by_aux is the only rule that looks past the edit's own
+    # tokens, and it is only reached for a VERB -> VERB first token pair.
+    if o0 < o1 and c0 < c1 and o.tag[o0] in verb_tags and c.tag[c0] in verb_tags:
+        aux = preceded_by_aux(o, o0, c, c0)
     else:
-        if edit.o_str == edit.c_str:
-            edit.type = "UNK"
-        elif edit.o_toks[-1].lower == edit.c_toks[-1].lower and (len(edit.o_toks) > 1 or len(edit.c_toks) > 1):
-            all_o_toks = edit.o_toks[:]
-            all_c_toks = edit.c_toks[:]
-            edit.o_toks = edit.o_toks[:-1]
-            edit.c_toks = edit.c_toks[:-1]
-            edit = classify(edit)
-            edit.o_toks = all_o_toks
-            edit.c_toks = all_c_toks
-        else:
-            op = "R:"
-            cat = get_two_sided_type(edit.o_toks, edit.c_toks)
-            edit.type = op+cat
+        aux = None
+    key = (o.signature(o0, o1), c.signature(c0, c1), same_str, aux)
+    edit_type = classify_cache.get(key)
+    if edit_type is None:
+        edit_type = get_type(o, o0, o1, c, c0, c1, same_str)
+        classify_cache.put(key, edit_type)
+    edit.type = edit_type
     return edit
 
-def get_one_sided_type(toks):
-    if len(toks) == 1:
-        if toks[0].tag_ == "POS":
+def get_type(o, o0, o1, c, c0, c1, same_str=False):
+    # Stripping a shared final token narrows the offsets instead of slicing
+    # Spans; same_str compares the full, unstripped edit texts.
+    while True:
+        if o0 == o1 and c0 == c1:
+            return "UNK"
+        elif o0 == o1:
+            return "M:"+get_one_sided_type(c, c0, c1)
+        elif c0 == c1:
+            return "U:"+get_one_sided_type(o, o0, o1)
+        elif same_str:
+            return "UNK"
+        elif o.lower[o1-1] == c.lower[c1-1] and (o1-o0 > 1 or c1-c0 > 1):
+            if metrics.enabled:
+                metrics.incr("classify.strips")
+            o1 -= 1
+            c1 -= 1
+        else:
+            return "R:"+get_two_sided_type(o, o0, o1, c, c0, c1)
+
+def get_one_sided_type(toks, start, end):
+    if end-start == 1:
+        if toks.tag_[start] == "POS":
             return "NOUN:POSS"
-        if toks[0].lower_ in conts:
+        if toks.lower_[start] in conts:
             return "CONTR"
-        if toks[0].lower_ == "to" and toks[0].pos == POS.PART and toks[0].dep_ != "prep":
+        if toks.lower_[start] == "to" and toks.pos[start] == POS.PART and toks.dep_[start] != "prep":
             return "VERB:FORM"
-    pos_list, dep_list = get_edit_info(toks)
+    pos_list, dep_list = get_edit_info(toks, start, end)
     if set(dep_list).issubset({"aux", "auxpass"}):
         return "VERB:TENSE"
     if len(set(pos_list)) == 1 and pos_list[0] not in rare_pos:
@@ -137,99 +166,92 @@ def get_one_sided_type(toks):
     else:
         return "OTHER"
 
-def get_edit_info(toks):
-    pos = []
-    dep = []
-    for tok in toks:
-        pos.append(pos_map[tok.tag_])
-        dep.append(tok.dep_)
-    return pos, dep
+def get_edit_info(toks, start, end):
+    return toks.coarse[start:end], toks.dep_[start:end]
 
-def only_orth_change(o_toks, c_toks):
-    o_join = "".join([o.lower_ for o in o_toks])
-    c_join = "".join([c.lower_ for c in c_toks])
+def only_orth_change(o, o0, o1, c, c0, c1):
+    o_join = "".join(o.lower_[o0:o1])
+    c_join = "".join(c.lower_[c0:c1])
     if o_join == c_join:
         return True
     return False
 
-def exact_reordering(o_toks, c_toks):
-    o_set = sorted([o.lower_ for o in o_toks])
-    c_set = sorted([c.lower_ for c in c_toks])
+def exact_reordering(o, o0, o1, c, c0, c1):
+    o_set = sorted(o.lower_[o0:o1])
+    c_set = sorted(c.lower_[c0:c1])
     if o_set == c_set:
         return True
     return False
 
-def preceded_by_aux(o_tok, c_tok):
-    if o_tok[0].dep_.startswith("aux") and c_tok[0].dep_.startswith("aux"):
-        o_head = o_tok[0].head
-        c_head = c_tok[0].head
-        o_children = o_head.children
-        c_children = c_head.children
+def preceded_by_aux(o, o_tok, c, c_tok):
+    if o.is_aux[o_tok] and c.is_aux[c_tok]:
+        o_children = o.children(o.head[o_tok])
+        c_children = c.children(c.head[c_tok])
         for o_child in o_children:
-            if o_child.dep_.startswith("aux"):
-                if o_child.text != o_tok[0].text:
+            if o.is_aux[o_child]:
+                if o.text[o_child] != o.text[o_tok]:
                     for c_child in c_children:
-                        if c_child.dep_.startswith("aux"):
-                            if c_child.text != c_tok[0].text:
+                        if c.is_aux[c_child]:
+                            if c.text[c_child] != c.text[c_tok]:
                                 return True
                             break
                 break
     else:
-        o_deps = [o_dep.dep_ for o_dep in o_tok[0].children]
-        c_deps = [c_dep.dep_ for c_dep in c_tok[0].children]
+        o_deps = [o.dep_[o_dep] for o_dep in o.children(o_tok)]
+        c_deps = [c.dep_[c_dep] for c_dep in c.children(c_tok)]
         if "aux" in o_deps or "auxpass" in o_deps:
             if "aux" in c_deps or "auxpass" in c_deps:
                 return True
     return False
 
-def get_two_sided_type(o_toks, c_toks):
-    o_pos, o_dep = get_edit_info(o_toks)
-    c_pos, c_dep = get_edit_info(c_toks)
-    if only_orth_change(o_toks, c_toks):
+def get_two_sided_type(o, o0, o1, c, c0, c1):
+    o_pos, o_dep = get_edit_info(o, o0, o1)
+    c_pos, c_dep = get_edit_info(c, c0, c1)
+    if only_orth_change(o, o0, o1, c, c0, c1):
         return "ORTH"
-    if exact_reordering(o_toks, c_toks):
+    if exact_reordering(o, o0, o1, c, c0, c1):
         return "WO"
-    if len(o_toks) == len(c_toks) == 1:
-        if o_toks[0].tag_ == "POS" or c_toks[0].tag_ == "POS":
+    if o1-o0 == c1-c0 == 1:
+        if o.tag_[o0] == "POS" or c.tag_[c0] == "POS":
             return "NOUN:POSS"
-        if (o_toks[0].lower_ in conts or c_toks[0].lower_ in conts) and o_pos == c_pos:
+        if (o.lower_[o0] in conts or c.lower_[c0] in conts) and o_pos == c_pos:
             return "CONTR"
-        if (o_toks[0].lower_ in aux_conts and c_toks[0].lower_ == aux_conts[o_toks[0].lower_]) or (c_toks[0].lower_ in aux_conts and o_toks[0].lower_ == aux_conts[c_toks[0].lower_]):
+        if (o.lower_[o0] in aux_conts and c.lower_[c0] == aux_conts[o.lower_[o0]]) or (c.lower_[c0] in aux_conts and o.lower_[o0] == aux_conts[c.lower_[c0]]):
             return "CONTR"
-        if o_toks[0].lower_ in aux_conts or c_toks[0].lower_ in aux_conts:
+        if o.lower_[o0] in aux_conts or c.lower_[c0] in aux_conts:
             return "VERB:TENSE"
-        if {o_toks[0].lower_, c_toks[0].lower_} == {"was", "were"}:
+        if {o.lower_[o0], c.lower_[c0]} == {"was", "were"}:
             return "VERB:SVA"
-        if o_toks[0].lemma == c_toks[0].lemma and o_pos[0] in open_pos2 and c_pos[0] in open_pos2:
+        if o.lemma[o0] == c.lemma[c0] and o_pos[0] in open_pos2 and c_pos[0] in open_pos2:
             if o_pos == c_pos:
                 if o_pos[0] == "ADJ":
                     return "ADJ:FORM"
                 if o_pos[0] == "NOUN":
                     return "NOUN:NUM"
                 if o_pos[0] == "VERB":
-                    if preceded_by_aux(o_toks, c_toks):
+                    if preceded_by_aux(o, o0, c, c0):
                         return "VERB:FORM"
-                    if o_toks[0].tag_ in {"VBG", "VBN"} or c_toks[0].tag_ in {"VBG", "VBN"}:
+                    if o.tag_[o0] in {"VBG", "VBN"} or c.tag_[c0] in {"VBG", "VBN"}:
                         return "VERB:FORM"
-                    if o_toks[0].tag_ == "VBD" or c_toks[0].tag_ == "VBD":
+                    if o.tag_[o0] == "VBD" or c.tag_[c0] == "VBD":
                         return "VERB:TENSE"
-                    if o_toks[0].tag_ == "VBZ" or c_toks[0].tag_ == "VBZ":
+                    if o.tag_[o0] == "VBZ" or c.tag_[c0] == "VBZ":
                         return "VERB:SVA"
                     if o_dep[0].startswith("aux") and c_dep[0].startswith("aux"):
                         return "VERB:TENSE"
             if set(o_dep+c_dep).issubset({"acomp", "amod"}):
                 return "ADJ:FORM"
-            if o_pos[0] == "ADJ" and c_toks[0].tag_ == "NNS":
+            if o_pos[0] == "ADJ" and c.tag_[c0] == "NNS":
                 return "NOUN:NUM"
-            if c_toks[0].tag_ in {"VBG", "VBN"}:
+            if c.tag_[c0] in {"VBG", "VBN"}:
                 return "VERB:FORM"
-            if c_toks[0].tag_ == "VBD":
+            if c.tag_[c0] == "VBD":
                 return "VERB:TENSE"
-            if c_toks[0].tag_ == "VBZ":
+            if c.tag_[c0] == "VBZ":
                 return "VERB:SVA"
             else:
                 return "MORPH"
-        if stemmer.stem(o_toks[0].text) == stemmer.stem(c_toks[0].text) and o_pos[0] in open_pos2 and c_pos[0] in open_pos2:
+        if stemmer.stem(o.text[o0]) == stemmer.stem(c.text[c0]) and o_pos[0] in open_pos2 and c_pos[0] in open_pos2:
             return "MORPH"
         if o_dep[0].startswith("aux") and c_dep[0].startswith("aux"):
             return "VERB:TENSE"
@@ -247,55 +269,55 @@ def get_two_sided_type(o_toks, c_toks):
                 return "DET"
         if set(o_pos+c_pos) == {"NUM", "DET"}:
             return "DET"
-        if {o_toks[0].lower_, c_toks[0].lower_} == {"other", "another"}:
+        if {o.lower_[o0], c.lower_[c0]} == {"other", "another"}:
             return "DET"
-        if o_toks[0].lower_ == "your" and c_toks[0].lower_ == "yours":
+        if o.lower_[o0] == "your" and c.lower_[c0] == "yours":
             return "PRON"
-        if {o_toks[0].lower_, c_toks[0].lower_} == {"no", "not"}:
+        if {o.lower_[o0], c.lower_[c0]} == {"no", "not"}:
             return "OTHER"
-        if o_toks[0].text.isalpha() and c_toks[0].text.isalpha():
-            str_sim = Levenshtein.normalized_similarity(o_toks[0].lower_, c_toks[0].lower_)
-            if len(o_toks[0].text) == 1:
-                if len(c_toks[0].text) == 2 and str_sim == 0.5:
+        if o.text[o0].isalpha() and c.text[c0].isalpha():
+            str_sim = Levenshtein.normalized_similarity(o.lower_[o0], c.lower_[c0])
+            if len(o.text[o0]) == 1:
+                if len(c.text[c0]) == 2 and str_sim == 0.5:
                     return "SPELL"
-            if len(o_toks[0].text) == 2:
-                if 2 <= len(c_toks[0].text) <= 3 and str_sim >= 0.5:
+            if len(o.text[o0]) == 2:
+                if 2 <= len(c.text[c0]) <= 3 and str_sim >= 0.5:
                     return "SPELL"
-            if len(o_toks[0].text) == 3:
-                if o_toks[0].lower_ == "the" and c_toks[0].lower_ == "that":
+            if len(o.text[o0]) == 3:
+                if o.lower_[o0] == "the" and c.lower_[c0] == "that":
                     return "PRON"
-                if o_toks[0].lower_ == "all" and c_toks[0].lower_ == "everything":
+                if o.lower_[o0] == "all" and c.lower_[c0] == "everything":
                     return "PRON"
-                if 2 <= len(c_toks[0].text) <= 4 and str_sim >= 0.5:
+                if 2 <= len(c.text[c0]) <= 4 and str_sim >= 0.5:
                     return "SPELL"
-            if len(o_toks[0].text) == 4:
-                if {o_toks[0].lower_, c_toks[0].lower_} == {"that", "what"}:
+            if len(o.text[o0]) == 4:
+                if {o.lower_[o0], c.lower_[c0]} == {"that", "what"}:
                     return "PRON"
-                if {o_toks[0].lower_, c_toks[0].lower_} == {"good", "well"} and c_pos[0] not in rare_pos:
+                if {o.lower_[o0], c.lower_[c0]} == {"good", "well"} and c_pos[0] not in rare_pos:
                     return c_pos[0]
-                if len(c_toks[0].text) == 3 and str_sim > 0.5:
+                if len(c.text[c0]) == 3 and str_sim > 0.5:
                     return "SPELL"
-                if len(c_toks[0].text) == 4 and str_sim >= 0.5:
+                if len(c.text[c0]) == 4 and str_sim >= 0.5:
                     return "SPELL"
-                if len(c_toks[0].text) == 5 and str_sim == 0.8:
+                if len(c.text[c0]) == 5 and str_sim == 0.8:
                     return "SPELL"
-                if len(c_toks[0].text) > 5 and str_sim > 0.5 and c_pos[0] not in rare_pos:
+                if len(c.text[c0]) > 5 and str_sim > 0.5 and c_pos[0] not in rare_pos:
                     return c_pos[0]
-            if len(o_toks[0].text) == 5:
-                if {o_toks[0].lower_, c_toks[0].lower_} == {"after", "later"} and c_pos[0] not in rare_pos:
+            if len(o.text[o0]) == 5:
+                if {o.lower_[o0], c.lower_[c0]} == {"after", "later"} and c_pos[0] not in rare_pos:
                     return c_pos[0]
-                if len(c_toks[0].text) == 4 and str_sim == 0.8:
+                if len(c.text[c0]) == 4 and str_sim == 0.8:
                     return "SPELL"
-                if len(c_toks[0].text) == 5 and str_sim >= 0.6:
+                if len(c.text[c0]) == 5 and str_sim >= 0.6:
                     return "SPELL"
-                if len(c_toks[0].text) > 5 and c_pos[0] not in rare_pos:
+                if len(c.text[c0]) > 5 and c_pos[0] not in rare_pos:
                     return c_pos[0]
-            if len(o_toks[0].text) > 5 and len(c_toks[0].text) > 5:
-                if o_toks[0].lower_ == "therefor" and c_toks[0].lower_ == "therefore":
+            if len(o.text[o0]) > 5 and len(c.text[c0]) > 5:
+                if o.lower_[o0] == "therefor" and c.lower_[c0] == "therefore":
                     return "SPELL"
-                if {o_toks[0].lower_, c_toks[0].lower_} == {"though", "thought"}:
+                if {o.lower_[o0], c.lower_[c0]} == {"though", "thought"}:
                     return "SPELL"
-                if (o_toks[0].text.startswith(c_toks[0].text) or c_toks[0].text.startswith(o_toks[0].text)) and str_sim >= 0.66:
+                if (o.text[o0].startswith(c.text[c0]) or c.text[c0].startswith(o.text[o0])) and str_sim >= 0.66:
                     return "MORPH"
                 if str_sim > 0.8:
                     return "SPELL"
@@ -306,20 +328,20 @@ def get_two_sided_type(o_toks, c_toks):
     if set(o_dep+c_dep).issubset({"aux", "auxpass"}):
         return "VERB:TENSE"
     if len(set(o_pos+c_pos)) == 1:
-        if o_pos[0] == "VERB" and o_toks[-1].lemma == c_toks[-1].lemma:
+        if o_pos[0] == "VERB" and o.lemma[o1-1] == c.lemma[c1-1]:
             return "VERB:TENSE"
         elif o_pos[0] not in rare_pos:
             return o_pos[0]
     if len(set(o_dep+c_dep)) == 1 and o_dep[0] in dep_map.keys():
         return dep_map[o_dep[0]]
     if set(o_pos+c_pos) == {"PART", "VERB"}:
-        if o_toks[-1].lemma == c_toks[-1].lemma:
+        if o.lemma[o1-1] == c.lemma[c1-1]:
             return "VERB:FORM"
         else:
             return "VERB"
-    if (o_pos == ["NOUN", "PART"] or c_pos == ["NOUN", "PART"]) and o_toks[0].lemma == c_toks[0].lemma:
+    if (o_pos == ["NOUN", "PART"] or c_pos == ["NOUN", "PART"]) and o.lemma[o0] == c.lemma[c0]:
         return "NOUN:POSS"
-    if (o_toks[0].lower_ in {"most", "more"} or c_toks[0].lower_ in {"most", "more"}) and o_toks[-1].lemma == c_toks[-1].lemma and len(o_toks) <= 2 and len(c_toks) <= 2:
+    if (o.lower_[o0] in {"most", "more"} or c.lower_[c0] in {"most", "more"}) and o.lemma[o1-1] == c.lemma[c1-1] and o1-o0 <= 2 and c1-c0 <= 2:
         return "ADJ:FORM"
     else:
         return "OTHER"
\ No newline at end of file